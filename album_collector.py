@@ -0,0 +1,124 @@
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+
+from blocking import run_blocking
+
+STAGING_PREFIX = '.staging-'
+# Staging directories older than this are left over from a crash and may be removed
+STALE_STAGING_AGE = 3600
+
+
+class AlbumCollector:
+    """Collects the photos of an album until no new one arrived for `quiet_period` seconds.
+
+    A photo sent on its own is treated as an album of one.
+    """
+
+    def __init__(self, quiet_period: float = 1.5, max_concurrent_downloads: int = 4):
+        self.quiet_period = quiet_period
+        self.max_concurrent_downloads = max_concurrent_downloads
+        self.albums = {}
+
+    @staticmethod
+    def _key(message):
+        return message.media_group_id or f"single-{message.chat_id}-{message.message_id}"
+
+    def add(self, message) -> bool:
+        """Adds a photo; returns True if it started a new album."""
+        key = self._key(message)
+        album = self.albums.get(key)
+        if album is None:
+            self.albums[key] = {'messages': [message], 'last_seen': time.monotonic()}
+            return True
+        album['messages'].append(message)
+        album['last_seen'] = time.monotonic()
+        return False
+
+    def is_collecting(self, message):
+        return self._key(message) in self.albums
+
+    async def wait(self, message):
+        key = self._key(message)
+        album = self.albums[key]
+        while True:
+            remaining = album['last_seen'] + self.quiet_period - time.monotonic()
+            if remaining <= 0:
+                break
+            await asyncio.sleep(remaining)
+        del self.albums[key]
+        return sorted(album['messages'], key=lambda item: item.message_id)
+
+    async def replace_directory(self, bot, messages, target_dir, process=None):
+        """Downloads the album into a staging directory and swaps it in place of `target_dir`.
+
+        `process`, if given, is awaited with the staged file paths before the swap.
+        Returns the new file names with the file_id each one was downloaded from.
+        """
+        versions_dir = f"{target_dir}.versions"
+        os.makedirs(versions_dir, exist_ok=True)
+        staging_dir = tempfile.mkdtemp(prefix=STAGING_PREFIX + time.strftime('%Y%m%d-%H%M%S-'), dir=versions_dir)
+        semaphore = asyncio.Semaphore(self.max_concurrent_downloads)
+
+        async def download(index, message):
+            file_id = message.photo[-1].file_id
+            file_name = f"{index:02d}_{file_id}.jpg"
+            async with semaphore:
+                new_file = await bot.get_file(file_id)
+                await new_file.download_to_drive(os.path.join(staging_dir, file_name))
+            return file_name, file_id
+
+        photos = [message for message in messages if message.photo]
+        try:
+            downloaded = await asyncio.gather(*(download(index, message) for index, message in enumerate(photos)))
+            if process is not None:
+                await process([os.path.join(staging_dir, file_name) for file_name, _ in downloaded])
+        except BaseException:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+            raise
+        # Drop the staging prefix so cleanup after later swaps treats it as a finished version
+        new_dir = os.path.join(versions_dir, os.path.basename(staging_dir)[len(STAGING_PREFIX):])
+        os.rename(staging_dir, new_dir)
+        await run_blocking(swap_directory, target_dir, new_dir)
+        return downloaded
+
+
+def swap_directory(target_dir, new_dir):
+    """Points `target_dir` at `new_dir` atomically.
+
+    `target_dir` becomes a symlink that is replaced with os.replace, so readers
+    see either the old or the new set of files. The previous version is kept
+    until the next swap for readers that are still sending it; readers must
+    resolve `target_dir` once (os.path.realpath) and use the resolved paths.
+    Staging directories of albums still downloading are left alone.
+    """
+    versions_dir = os.path.dirname(new_dir)
+    previous = os.path.realpath(target_dir) if os.path.islink(target_dir) else None
+    if os.path.isdir(target_dir) and not os.path.islink(target_dir):
+        # One-time migration from a plain directory; paths listed before it are not retained
+        previous = os.path.join(versions_dir, 'initial')
+        os.rename(target_dir, previous)
+    tmp_link = f"{target_dir}.tmp-link"
+    if os.path.lexists(tmp_link):
+        os.unlink(tmp_link)
+    try:
+        os.symlink(os.path.relpath(new_dir, os.path.dirname(os.path.abspath(target_dir))), tmp_link,
+                   target_is_directory=True)
+    except OSError:
+        # No symlink support (e.g. Windows without privileges): fall back to a rename
+        if os.path.lexists(target_dir):
+            os.rename(target_dir, os.path.join(versions_dir, f"replaced-{time.time_ns()}"))
+        os.rename(new_dir, target_dir)
+    else:
+        os.replace(tmp_link, target_dir)
+    keep = {os.path.realpath(path) for path in (new_dir, previous) if path}
+    now = time.time()
+    for name in os.listdir(versions_dir):
+        path = os.path.join(versions_dir, name)
+        if os.path.realpath(path) in keep:
+            continue
+        if name.startswith(STAGING_PREFIX) and now - os.path.getmtime(path) < STALE_STAGING_AGE:
+            continue
+        shutil.rmtree(path, ignore_errors=True)
@@ -0,0 +1,192 @@
+import asyncio
+import bisect
+import datetime
+import json
+import logging
+import os
+import time
+from collections import defaultdict
+
+from blocking import run_blocking
+
+logger = logging.getLogger(__name__)
+
+DAY = 86400
+LANGUAGE_COLUMN = 4
+
+
+class AudienceIndex:
+    """Broadcast segments over every known user.
+
+    Users arrive from rows appended to the users sheet, read incrementally
+    past `cursor`, and from activity the bot records itself. Secondary indexes
+    by language, first-seen time and last-seen day turn each segment into a
+    few set lookups instead of a scan.
+    """
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+        self.cursor = 0
+        # user_id -> [language, first_seen, last_seen]
+        self.users = {}
+        self.by_language = defaultdict(set)
+        self.first_seen = []
+        self.by_day = defaultdict(set)
+        self._disk_dirty = False
+        self._lock = None
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.file_path):
+            return
+        with open(self.file_path, 'r', encoding='utf-8') as file:
+            data = json.load(file)
+        self.cursor = data.get('cursor', 0)
+        for user_id, (language, first_seen, last_seen) in data.get('users', {}).items():
+            self.observe(int(user_id), language, first_seen, last_seen)
+        self._disk_dirty = False
+
+    def snapshot(self):
+        return {'cursor': self.cursor, 'users': {str(user_id): list(entry) for user_id, entry in self.users.items()}}
+
+    def save(self, data=None):
+        if data is None:
+            data = self.snapshot()
+        tmp_path = f"{self.file_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump(data, file)
+        os.replace(tmp_path, self.file_path)
+        self._disk_dirty = False
+
+    def observe(self, user_id, language=None, first_seen=None, last_seen=None):
+        entry = self.users.get(user_id)
+        if entry is None:
+            entry = self.users[user_id] = [None, None, None]
+            self._disk_dirty = True
+        if language and language != entry[0]:
+            if entry[0]:
+                self.by_language[entry[0]].discard(user_id)
+            self.by_language[language].add(user_id)
+            entry[0] = language
+            self._disk_dirty = True
+        if first_seen and (entry[1] is None or first_seen < entry[1]):
+            if entry[1] is not None:
+                del self.first_seen[bisect.bisect_left(self.first_seen, (entry[1], user_id))]
+            bisect.insort(self.first_seen, (first_seen, user_id))
+            entry[1] = first_seen
+            self._disk_dirty = True
+        if last_seen and (entry[2] is None or last_seen > entry[2]):
+            if entry[2] is not None and entry[2] // DAY != last_seen // DAY:
+                self.by_day[entry[2] // DAY].discard(user_id)
+            self.by_day[last_seen // DAY].add(user_id)
+            entry[2] = last_seen
+            self._disk_dirty = True
+
+    def merge_registry(self, users):
+        for user_id, info in users.items():
+            self.observe(user_id, info.get('language'), info.get('first_seen'), info.get('last_seen'))
+
+    async def refresh(self, sheets, sheet_name):
+        """Reads only the sheet rows appended since the last refresh."""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            rows = await sheets.call(sheet_name, 'get_values', f"A{self.cursor + 1}:E")
+            for row in rows:
+                if row and row[0].isdigit():
+                    language = row[LANGUAGE_COLUMN] if len(row) > LANGUAGE_COLUMN else None
+                    self.observe(int(row[0]), language if language not in ('', 'None') else None)
+            if rows:
+                self.cursor += len(rows)
+                self._disk_dirty = True
+            return len(rows)
+
+    def select(self, language=None, first_seen_from=None, first_seen_to=None, active_days=None, now=None):
+        """Returns the ids matching every given filter; no filters means everyone."""
+        selected = None
+        if language:
+            selected = set(self.by_language.get(language, ()))
+        if first_seen_from is not None or first_seen_to is not None:
+            low = bisect.bisect_left(self.first_seen, (first_seen_from or 0,))
+            high = (bisect.bisect_left(self.first_seen, (first_seen_to,)) if first_seen_to is not None
+                    else len(self.first_seen))
+            matching = {user_id for _, user_id in self.first_seen[low:high]}
+            selected = matching if selected is None else selected & matching
+        if active_days:
+            today = int(now or time.time()) // DAY
+            matching = set()
+            for day in range(today - active_days + 1, today + 1):
+                matching |= self.by_day.get(day, set())
+            selected = matching if selected is None else selected & matching
+        return set(self.users) if selected is None else selected
+
+    def language_counts(self):
+        return sorted(((language, len(user_ids)) for language, user_ids in self.by_language.items() if user_ids),
+                      key=lambda item: -item[1])
+
+
+def _parse_day(value):
+    return int(datetime.datetime.strptime(value, '%Y-%m-%d').replace(tzinfo=datetime.timezone.utc).timestamp())
+
+
+def parse_segment(text):
+    """Splits an optional filter line off the start of a broadcast message.
+
+    The first line is a filter when every word on it is one of `lang=ro`,
+    `activ=<days>` or `nou=<YYYY-MM-DD>..<YYYY-MM-DD>` (either end optional).
+    Returns (segment, message); raises ValueError for malformed filters.
+    """
+    first_line, _, rest = text.partition('\n')
+    words = first_line.split()
+    if not words or not all(word.split('=', 1)[0] in ('lang', 'activ', 'nou') and '=' in word for word in words):
+        return {}, text
+    segment = {}
+    for word in words:
+        key, value = word.split('=', 1)
+        if key == 'lang':
+            segment['language'] = value.lower()
+        elif key == 'activ':
+            if not value.isdigit() or int(value) == 0:
+                raise ValueError(f"activ trebuie să fie un număr de zile, nu '{value}'")
+            segment['active_days'] = int(value)
+        else:
+            start, separator, end = value.partition('..')
+            try:
+                if start:
+                    segment['first_seen_from'] = _parse_day(start)
+                if end:
+                    segment['first_seen_to'] = _parse_day(end) + DAY
+                elif not separator:
+                    segment['first_seen_to'] = _parse_day(start) + DAY
+            except ValueError:
+                raise ValueError(f"nou trebuie să fie de forma 2024-01-01..2024-01-31, nu '{value}'")
+    if not rest.strip():
+        raise ValueError("după linia de filtre urmează textul mesajului")
+    return segment, rest
+
+
+def describe_segment(segment):
+    if not segment:
+        return "toți utilizatorii"
+    parts = []
+    if 'language' in segment:
+        parts.append(f"limba {segment['language']}")
+    if 'active_days' in segment:
+        parts.append(f"activi în ultimele {segment['active_days']} zile")
+    if 'first_seen_from' in segment or 'first_seen_to' in segment:
+        start = segment.get('first_seen_from')
+        end = segment.get('first_seen_to')
+        start_text = time.strftime('%Y-%m-%d', time.gmtime(start)) if start else '…'
+        end_text = time.strftime('%Y-%m-%d', time.gmtime(end - DAY)) if end else '…'
+        parts.append(f"înregistrați {start_text} – {end_text}")
+    return ', '.join(parts)
+
+
+async def run_save_loop(index: AudienceIndex, interval: float = 60):
+    while True:
+        await asyncio.sleep(interval)
+        if index._disk_dirty:
+            try:
+                await run_blocking(index.save, index.snapshot())
+            except Exception as e:
+                logger.warning(f"Saving the audience index failed: {e}")
@@ -0,0 +1,94 @@
+"""Time to first response after launching the bot process, fully offline.
+
+Each round starts `python main.py` in a scratch copy of the content files,
+pointed at a local fake Bot API through BOT_API_BASE_URL, with a /start update
+already waiting. The time from launch until getMe, the first getUpdates and
+the reply to /start reaches the fake API is measured.
+
+Usage: python benchmarks/bench_cold_start.py [rounds] [api_latency_ms]
+"""
+import asyncio
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_bot_api import FakeBotAPI
+from load_test import prepare_workdir
+
+TOKEN = '123:cold-start'
+USER_ID = 4242
+
+
+def start_update():
+    return {'update_id': 1,
+            'message': {'message_id': 1, 'date': int(time.time()), 'text': '/start',
+                        'entities': [{'type': 'bot_command', 'offset': 0, 'length': 6}],
+                        'chat': {'id': USER_ID, 'type': 'private'},
+                        'from': {'id': USER_ID, 'is_bot': False, 'first_name': 'Cold'}}}
+
+
+async def launch_once(latency):
+    api = FakeBotAPI(latency=latency)
+    await api.start()
+    api.push_update(start_update())
+    with tempfile.TemporaryDirectory() as directory:
+        prepare_workdir(directory)
+        with open(os.path.join(directory, '.env'), 'w', encoding='utf-8') as file:
+            file.write(TOKEN)
+        env = dict(os.environ, BOT_API_BASE_URL=api.base_url, BOT_API_BASE_FILE_URL=api.base_file_url)
+        get_me = api.wait_for('getMe')
+        get_updates = api.wait_for('getUpdates')
+        reply = api.wait_for('sendPhoto', lambda params: int(params.get('chat_id', 0)) == USER_ID)
+        launched = time.perf_counter()
+        process = subprocess.Popen([sys.executable, os.path.join(ROOT, 'main.py')], cwd=directory, env=env,
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        try:
+            timings = [await asyncio.wait_for(waiter, 60) - launched for waiter in (get_me, get_updates, reply)]
+        finally:
+            process.send_signal(signal.SIGINT)
+            _, stderr = await asyncio.get_running_loop().run_in_executor(None, process.communicate)
+            await api.stop()
+    return timings, startup_report(stderr.decode(errors='replace'))
+
+
+def startup_report(log):
+    # The bot's own phase breakdown: the lines following "Startup timing:" up to the next log record
+    lines = log.splitlines()
+    start = next((index for index, line in enumerate(lines) if 'Startup timing:' in line), None)
+    if start is None:
+        return []
+    report = []
+    for line in lines[start + 1:]:
+        if not line.strip() or line[:4].isdigit():
+            break
+        report.append(line)
+    return report
+
+
+async def bench(rounds, latency):
+    results = []
+    report = []
+    for _ in range(rounds):
+        timings, report = await launch_once(latency)
+        results.append(timings)
+    print(f"rounds={rounds} api_latency={latency * 1000:.0f}ms")
+    for index, name in enumerate(('getMe', 'first getUpdates', 'reply to /start')):
+        values = [timings[index] * 1000 for timings in results]
+        print(f"{name:<18} median={statistics.median(values):8.1f} ms  min={min(values):8.1f} ms  "
+              f"max={max(values):8.1f} ms")
+    if report:
+        print("\nStartup timing reported by the last run:")
+        print('\n'.join(report))
+
+
+if __name__ == '__main__':
+    asyncio.run(bench(int(sys.argv[1]) if len(sys.argv) > 1 else 5,
+                      float(sys.argv[2]) / 1000 if len(sys.argv) > 2 else 0.0))
@@ -0,0 +1,60 @@
+"""Flush time and file size: PicklePersistence vs. SQLitePersistence.
+
+Each run stores N conversation states, then changes 1% of them and measures
+how long it takes to get that round onto disk.
+
+Usage: python benchmarks/bench_persistence.py [N ...]
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegram.ext import ExtBot, PicklePersistence
+
+from sqlite_persistence import SQLitePersistence
+
+NAME = 'drink_stock_conversation'
+
+
+async def run_round(persistence, updates):
+    start = time.perf_counter()
+    await asyncio.gather(*(persistence.update_conversation(NAME, key, state) for key, state in updates))
+    await persistence.update_bot_data({})
+    if isinstance(persistence, PicklePersistence):
+        await persistence.flush()
+    return time.perf_counter() - start
+
+
+async def bench(persistence, path, users):
+    persistence.set_bot(ExtBot('123:bench'))
+    await persistence.get_conversations(NAME)
+    await persistence.get_bot_data()
+    initial = [((user_id, user_id), 1) for user_id in range(users)]
+    initial_time = await run_round(persistence, initial)
+    changed = [((user_id, user_id), 5) for user_id in range(0, users, 100)]
+    changed_time = await run_round(persistence, changed)
+    if isinstance(persistence, SQLitePersistence):
+        await persistence.flush()
+    size = sum(os.path.getsize(os.path.join(os.path.dirname(path), file))
+               for file in os.listdir(os.path.dirname(path)))
+    return initial_time, changed_time, size
+
+
+async def main(sizes):
+    print(f"{'users':>8} {'backend':<8} {'first flush':>12} {'1% changed':>12} {'file size':>12}")
+    for users in sizes:
+        for label, factory in (('pickle', lambda path: PicklePersistence(path, on_flush=True)),
+                               ('sqlite', SQLitePersistence)):
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, 'state')
+                initial_time, changed_time, size = await bench(factory(path), path, users)
+            print(f"{users:>8} {label:<8} {initial_time * 1000:>9.1f} ms {changed_time * 1000:>9.1f} ms "
+                  f"{size / 1024:>9.1f} KB")
+
+
+if __name__ == '__main__':
+    asyncio.run(main([int(arg) for arg in sys.argv[1:]] or [10_000, 100_000]))
@@ -0,0 +1,67 @@
+"""Callback dispatch cost per update: regex CallbackQueryHandler chain vs. CallbackRouter.
+
+Usage: python benchmarks/bench_router.py
+"""
+import os
+import sys
+import timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+from telegram import CallbackQuery, Update, User
+from telegram.ext import CallbackQueryHandler
+
+import main
+
+# The chain main() registered for BACK_TO_START before the router
+REGEX_CHAIN = [
+    CallbackQueryHandler(main.contact, pattern='contact'),
+    CallbackQueryHandler(main.map_locations, pattern='map'),
+    CallbackQueryHandler(main.offer, pattern='offer'),
+    CallbackQueryHandler(main.review, pattern='review'),
+    CallbackQueryHandler(main.handle_back, pattern='back'),
+    CallbackQueryHandler(main.cocktail_recipe, pattern='cocktail'),
+    CallbackQueryHandler(main.change_addresses, pattern='change_addresses'),
+    CallbackQueryHandler(main.change_admins, pattern='change_admins'),
+    CallbackQueryHandler(main.change_cocktail_recipe, pattern='change_cocktail_recipe'),
+    CallbackQueryHandler(main.change_contact_info, pattern='change_contact_info'),
+    CallbackQueryHandler(main.change_start_message, pattern='change_start_message'),
+    CallbackQueryHandler(main.change_review, pattern='change_review'),
+    CallbackQueryHandler(main.change_offers, pattern='change_offers'),
+    CallbackQueryHandler(main.send_broadcast, pattern='send_broadcast'),
+]
+
+
+def make_update(data, username):
+    user = User(id=1, first_name='Bench', is_bot=False, username=username)
+    return Update(update_id=1, callback_query=CallbackQuery(id='1', from_user=user, chat_instance='1', data=data))
+
+
+def dispatch_regex(update):
+    for handler in REGEX_CHAIN:
+        if handler.check_update(update):
+            return handler
+
+
+def dispatch_router(handlers, update):
+    # One handler for the blocking routes and one for the non-blocking ones
+    for handler in handlers:
+        if handler.check_update(update):
+            return handler
+
+
+def main_bench(number=20000):
+    router_handlers = main.callback_router.handlers(main.BACK_TO_START)
+    admin = next(iter(main.content_store.admins), None)
+    print(f"{'callback_data':<24}{'regex chain':>14}{'router':>14}")
+    for data in ('map', 'back', 'send_broadcast', 'unknown'):
+        update = make_update(data, admin)
+        regex_time = timeit.timeit(lambda: dispatch_regex(update), number=number) / number
+        router_time = timeit.timeit(lambda: dispatch_router(router_handlers, update), number=number) / number
+        print(f"{data:<24}{regex_time * 1e6:>11.2f} us{router_time * 1e6:>11.2f} us")
+
+
+if __name__ == '__main__':
+    main_bench()
@@ -0,0 +1,38 @@
+"""Inline search cost per query: cached answers, uncached answers and index rebuilds.
+
+Usage: python benchmarks/bench_search.py
+"""
+import os
+import sys
+import timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+import main
+
+QUERIES = ('', 'buicani', 'decebal', 'Rîșcan', 'riscan', 'str dece', 'chis bota', 'cocktail', 'xyz')
+
+
+def main_bench(number=20000):
+    index = main.search_index
+    index.refresh()
+    print(f"{len(index.entries)} entries, {len(index.prefixes)} prefixes")
+    print(f"{'query':<14}{'results':>8}{'cached':>12}{'uncached':>12}")
+    for query in QUERIES:
+        results = index.search(query)
+        cached = timeit.timeit(lambda: index.search(query), number=number) / number
+
+        def uncached():
+            index.cache.clear()
+            index.search(query)
+
+        cold = timeit.timeit(uncached, number=number) / number
+        print(f"{query!r:<14}{len(results):>8}{cached * 1e6:>9.2f} us{cold * 1e6:>9.2f} us")
+    rebuild = timeit.timeit(index.rebuild, number=200) / 200
+    print(f"rebuild after save_new_addresses / save_new_cocktail_recipe: {rebuild * 1e3:.2f} ms")
+
+
+if __name__ == '__main__':
+    main_bench()
@@ -0,0 +1,133 @@
+"""End-to-end handling latency: polling vs. webhook, fully offline.
+
+Recorded updates from recorded_updates.json are delivered through a local fake
+Bot API (polling) or POSTed to the bot's webhook endpoint, and the time until
+the bot's reply reaches the fake API is measured.
+
+Usage: python benchmarks/bench_webhook.py [rounds] [api_latency_ms]
+"""
+import asyncio
+import copy
+import json
+import logging
+import os
+import socket
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.chdir(ROOT)
+
+import httpx
+
+import main
+from fake_bot_api import FakeBotAPI
+from media_cache import MediaCache
+
+logging.getLogger().setLevel(logging.WARNING)
+
+TOKEN = '123:offline'
+SECRET = 'offline-secret'
+
+with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'recorded_updates.json'), encoding='utf-8') as file:
+    RECORDED = json.load(file)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def numbered(rounds):
+    update_id = 0
+    for _ in range(rounds):
+        for recorded in RECORDED:
+            update_id += 1
+            update = copy.deepcopy(recorded['update'])
+            update['update_id'] = update_id
+            yield recorded['expect'], update
+
+
+async def settle_all(application):
+    # Non-blocking routes finish after their reply; the next recorded tap must not find them still running
+    for handler in application.handlers[0]:
+        tasks = [state.task for state in getattr(handler, '_conversations', {}).values() if hasattr(state, 'task')]
+        if tasks:
+            await asyncio.wait(tasks)
+
+
+async def run_polling(api, application, rounds):
+    await application.updater.start_polling(poll_interval=0, timeout=10, allowed_updates=main.ALLOWED_UPDATES)
+    latencies = []
+    for expect, update in numbered(rounds):
+        reply = api.wait_for(expect)
+        start = time.perf_counter()
+        api.push_update(update)
+        latencies.append(await reply - start)
+        await settle_all(application)
+    return latencies
+
+
+async def run_webhook(api, application, rounds):
+    port = free_port()
+    await application.updater.start_webhook(listen='127.0.0.1', port=port, url_path='telegram',
+                                            webhook_url=f'http://127.0.0.1:{port}/telegram',
+                                            secret_token=SECRET, allowed_updates=main.ALLOWED_UPDATES)
+    url = f'http://127.0.0.1:{port}/telegram'
+    latencies = []
+    async with httpx.AsyncClient() as client:
+        rejected = await client.post(url, json=RECORDED[0]['update'],
+                                     headers={'X-Telegram-Bot-Api-Secret-Token': 'wrong'})
+        assert rejected.status_code == 403, rejected.status_code
+        for expect, update in numbered(rounds):
+            reply = api.wait_for(expect)
+            start = time.perf_counter()
+            await client.post(url, json=update, headers={'X-Telegram-Bot-Api-Secret-Token': SECRET})
+            latencies.append(await reply - start)
+            await settle_all(application)
+    return latencies
+
+
+async def measure(mode, rounds, latency):
+    api = FakeBotAPI(latency=latency)
+    await api.start()
+    with tempfile.TemporaryDirectory() as directory:
+        # Fake file_ids must not end up in the real media cache
+        main.media_cache = MediaCache(os.path.join(directory, 'media_cache.json'))
+        # Every round replays the same user's taps; flood control would answer them with a toast only
+        main.callback_router.flood_control = None
+        application = main.build_application(TOKEN, persistence_path=os.path.join(directory, 'state.sqlite3'),
+                                             base_url=api.base_url)
+        await application.initialize()
+        await application.start()
+        try:
+            runner = run_polling if mode == 'polling' else run_webhook
+            return await runner(api, application, rounds)
+        finally:
+            await application.updater.stop()
+            await application.stop()
+            await application.shutdown()
+            await api.stop()
+
+
+def report(mode, latencies):
+    ordered = sorted(latencies)
+    p95 = ordered[int(len(ordered) * 0.95) - 1]
+    print(f"{mode:<8} n={len(latencies):<5} mean={statistics.mean(latencies) * 1000:7.2f} ms "
+          f"p50={statistics.median(latencies) * 1000:7.2f} ms p95={p95 * 1000:7.2f} ms")
+
+
+async def bench(rounds, latency):
+    print(f"Simulated Bot API latency: {latency * 1000:.0f} ms")
+    for mode in ('polling', 'webhook'):
+        report(mode, await measure(mode, rounds, latency))
+
+
+if __name__ == '__main__':
+    asyncio.run(bench(int(sys.argv[1]) if len(sys.argv) > 1 else 50,
+                      float(sys.argv[2]) / 1000 if len(sys.argv) > 2 else 0.0))
@@ -0,0 +1,88 @@
+"""Throughput of the multi-worker mode against the number of worker processes.
+
+A fake update source feeds /start from distinct users straight into a
+WorkerPool, which shards them by chat id over N bot processes; all of them
+talk to one local fake Bot API. The time until every user got the menu back
+is measured. Each run uses a scratch copy of the content files.
+
+Usage: python benchmarks/bench_workers.py [--workers 1 2 4] [--users 400] [--api-latency 20]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_bot_api import FakeBotAPI
+from load_test import prepare_workdir
+from workers import WorkerPool
+
+TOKEN = '123:workers'
+
+
+def start_update(update_id, user_id):
+    return {'update_id': update_id,
+            'message': {'message_id': update_id, 'date': int(time.time()), 'text': '/start',
+                        'entities': [{'type': 'bot_command', 'offset': 0, 'length': 6}],
+                        'chat': {'id': user_id, 'type': 'private'},
+                        'from': {'id': user_id, 'is_bot': False, 'first_name': f'User{user_id}'}}}
+
+
+async def measure(count, users, latency):
+    api = FakeBotAPI(latency=latency)
+    await api.start()
+    loop = asyncio.get_running_loop()
+    pool = WorkerPool(TOKEN, count, base_url=api.base_url, base_file_url=api.base_file_url,
+                      log_level=logging.WARNING)
+    pool.start()
+    try:
+        if not await loop.run_in_executor(None, pool.wait_ready, 120):
+            raise RuntimeError("workers did not start")
+        replies = 0
+
+        def all_answered(params):
+            nonlocal replies
+            replies += 1
+            return replies >= users
+
+        done = api.wait_for('sendPhoto', all_answered)
+        start = time.perf_counter()
+        for index in range(users):
+            pool.dispatch(start_update(index + 1, 100_000 + index))
+        return await done - start
+    finally:
+        await loop.run_in_executor(None, pool.stop)
+        await api.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--users', type=int, default=400)
+    parser.add_argument('--api-latency', type=float, default=20, help='fake Bot API latency in ms')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    print(f"users={args.users} api_latency={args.api_latency}ms "
+          f"concurrent_updates={os.environ.get('CONCURRENT_UPDATES', '0')}")
+    baseline = None
+    for count in args.workers:
+        with tempfile.TemporaryDirectory() as directory:
+            prepare_workdir(directory)
+            os.chdir(directory)
+            try:
+                elapsed = asyncio.run(measure(count, args.users, args.api_latency / 1000))
+            finally:
+                os.chdir(ROOT)
+        throughput = args.users / elapsed
+        baseline = baseline or throughput
+        print(f"workers={count:<3} wall={elapsed:7.2f}s  {throughput:8.1f} updates/s  x{throughput / baseline:.2f}")
+
+
+if __name__ == '__main__':
+    main()
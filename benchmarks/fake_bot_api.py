@@ -0,0 +1,126 @@
+"""Local stand-in for the Telegram Bot API, used by the offline benchmarks.
+
+Point the bot at it with `build_application(token, base_url=api.base_url)`.
+Every call is recorded; updates queued with `push_update()` are served to
+`getUpdates` long polls.
+"""
+import asyncio
+import itertools
+import json
+import os
+import time
+
+import tornado.web
+from tornado.httpserver import HTTPServer
+from tornado.netutil import bind_sockets
+
+# Downloads serve a real photo so the image pipeline has something to work on
+with open(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'logo.jpg'), 'rb') as _file:
+    PHOTO_BYTES = _file.read()
+
+BOT_USER = {'id': 1, 'is_bot': True, 'first_name': 'DrinkStockBot', 'username': 'drinkstock_bot'}
+
+
+class FakeBotAPI:
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = []
+        self.updates = asyncio.Queue()
+        self.waiters = []
+        self._message_ids = itertools.count(1)
+        self._file_ids = itertools.count(1)
+        self._server = None
+        self.port = None
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.port}/bot"
+
+    @property
+    def base_file_url(self):
+        return f"http://127.0.0.1:{self.port}/file/bot"
+
+    async def start(self):
+        app = tornado.web.Application([(r'/bot[^/]+/(\w+)', _MethodHandler, {'api': self}),
+                                       (r'/file/bot[^/]+/(.+)', _FileHandler)])
+        sockets = bind_sockets(0, '127.0.0.1')
+        self.port = sockets[0].getsockname()[1]
+        self._server = HTTPServer(app)
+        self._server.add_sockets(sockets)
+
+    async def stop(self):
+        self._server.stop()
+
+    def push_update(self, update: dict):
+        self.updates.put_nowait(update)
+
+    def wait_for(self, method, predicate=None):
+        future = asyncio.get_running_loop().create_future()
+        self.waiters.append((method, predicate, future))
+        return future
+
+    def _record(self, method, params):
+        now = time.perf_counter()
+        self.calls.append((method, now, params))
+        for waiter in list(self.waiters):
+            waiter_method, predicate, future = waiter
+            if waiter_method == method and (predicate is None or predicate(params)) and not future.done():
+                future.set_result(now)
+                self.waiters.remove(waiter)
+
+    def _message(self, params, **extra):
+        return dict({'message_id': next(self._message_ids), 'date': int(time.time()),
+                     'chat': {'id': int(params.get('chat_id', 1)), 'type': 'private'}, 'from': BOT_USER}, **extra)
+
+    def _photo(self):
+        file_number = next(self._file_ids)
+        return [{'file_id': f'photo-{file_number}', 'file_unique_id': f'unique-{file_number}',
+                 'width': 1280, 'height': 1280, 'file_size': 1024}]
+
+    async def handle(self, method, params):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if method == 'getUpdates':
+            try:
+                update = await asyncio.wait_for(self.updates.get(), float(params.get('timeout') or 0) or 0.1)
+            except (asyncio.TimeoutError, asyncio.CancelledError):
+                return []
+            self._record(method, params)
+            return [update]
+        self._record(method, params)
+        if method == 'getMe':
+            return BOT_USER
+        if method in ('sendPhoto',):
+            return self._message(params, photo=self._photo(), caption=params.get('caption'))
+        if method == 'sendMediaGroup':
+            media = json.loads(params.get('media', '[]'))
+            return [self._message(params, photo=self._photo()) for _ in media]
+        if method in ('sendMessage', 'editMessageText'):
+            return self._message(params, text=params.get('text', ''))
+        if method == 'editMessageCaption':
+            return self._message(params, photo=self._photo(), caption=params.get('caption'))
+        if method == 'getFile':
+            return {'file_id': params['file_id'], 'file_unique_id': params['file_id'],
+                    'file_path': f"photos/{params['file_id']}.jpg"}
+        return True
+
+
+class _MethodHandler(tornado.web.RequestHandler):
+    def initialize(self, api):
+        self.api = api
+
+    async def post(self, method):
+        if self.request.headers.get('Content-Type', '').startswith('application/json'):
+            params = json.loads(self.request.body or b'{}')
+        else:
+            params = {key: values[0].decode() for key, values in self.request.body_arguments.items()}
+        result = await self.api.handle(method, params)
+        self.write({'ok': True, 'result': result})
+
+    get = post
+
+
+class _FileHandler(tornado.web.RequestHandler):
+    def get(self, path):
+        self.set_header('Content-Type', 'image/jpeg')
+        self.write(PHOTO_BYTES)
@@ -0,0 +1,253 @@
+"""Offline load test for the handlers in main.py.
+
+Simulated users go through /start, map, back, offer, back, cocktail, back
+against a local fake Bot API and a fake "DrinkStock" worksheet, both with
+configurable latency. An admin then uploads an offer album and sends a
+broadcast to every simulated user. The bot runs in a scratch copy of the
+content files, so nothing in the working tree is touched.
+
+Usage: python benchmarks/load_test.py --users 2000 --concurrency 50 [--json results.json]
+"""
+import argparse
+import asyncio
+import glob
+import json
+import logging
+import os
+import re
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_bot_api import FakeBotAPI
+
+TOKEN = '123:load-test'
+USER_FLOW = ('map', 'back', 'offer', 'back', 'cocktail', 'back')
+
+
+class FakeWorksheet:
+    """In-memory gspread worksheet with a fixed per-call latency."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.rows = []
+        self.calls = defaultdict(int)
+
+    def _call(self, name):
+        self.calls[name] += 1
+        time.sleep(self.latency)
+
+    def get_all_values(self):
+        self._call('get_all_values')
+        return [list(row) for row in self.rows]
+
+    def get_values(self, range_name):
+        self._call('get_values')
+        first_row = int(re.match(r'A(\d+)', range_name).group(1))
+        return [list(row) for row in self.rows[first_row - 1:]]
+
+    def append_rows(self, rows, table_range=None):
+        self._call('append_rows')
+        first_row = len(self.rows) + 1
+        self.rows.extend([str(value) for value in row] for row in rows)
+        return {'updates': {'updatedRange': f"Sheet1!A{first_row}:E{len(self.rows)}"}}
+
+    def batch_update(self, updates):
+        self._call('batch_update')
+        for update in updates:
+            row = int(re.match(r'A(\d+)', update['range']).group(1))
+            self.rows[row - 1] = [str(value) for value in update['values'][0]]
+
+
+def prepare_workdir(directory):
+    for path in glob.glob(os.path.join(ROOT, '*.html')) + [os.path.join(ROOT, 'admins.txt'),
+                                                           os.path.join(ROOT, 'logo.jpg')]:
+        shutil.copy(path, directory)
+    shutil.copytree(os.path.join(ROOT, 'recipes'), os.path.join(directory, 'recipes'))
+    shutil.copytree(os.path.join(ROOT, 'recipes'), os.path.join(directory, 'offers'))
+
+
+async def settle(application, update):
+    # Non-blocking routes run as tasks; wait for them like a user waits for the reply before tapping again
+    for handler in application.handlers[0]:
+        state = getattr(handler, '_conversations', {}).get((update.effective_chat.id, update.effective_user.id))
+        if getattr(state, 'task', None) is not None:
+            await asyncio.wait([state.task])
+
+
+class Simulator:
+    def __init__(self, main, application, api):
+        self.main = main
+        self.application = application
+        self.api = api
+        self.timings = defaultdict(list)
+        self._update_ids = iter(range(1, 10 ** 9))
+        self._message_ids = iter(range(1, 10 ** 9))
+
+    def _user(self, user_id, username=None):
+        return {'id': user_id, 'is_bot': False, 'first_name': f'User{user_id}',
+                'username': username, 'language_code': 'ro' if user_id % 3 else 'ru'}
+
+    def _message(self, user_id, **extra):
+        return dict({'message_id': next(self._message_ids), 'date': int(time.time()),
+                     'chat': {'id': user_id, 'type': 'private'}}, **extra)
+
+    def message_update(self, user_id, username=None, **extra):
+        return {'update_id': next(self._update_ids),
+                'message': self._message(user_id, **extra, **{'from': self._user(user_id, username)})}
+
+    def callback_update(self, user_id, data, username=None):
+        message = self._message(user_id, text='menu')
+        return {'update_id': next(self._update_ids),
+                'callback_query': {'id': str(next(self._update_ids)), 'chat_instance': '1', 'data': data,
+                                   'from': self._user(user_id, username), 'message': message}}
+
+    async def send(self, name, data):
+        update = self.main.Update.de_json(data, self.application.bot)
+        start = time.perf_counter()
+        await self.application.process_update(update)
+        if update.callback_query:
+            await settle(self.application, update)
+        self.timings[name].append(time.perf_counter() - start)
+
+    async def user_session(self, user_id):
+        await self.send('start', self.message_update(user_id, text='/start',
+                                                     entities=[{'type': 'bot_command', 'offset': 0, 'length': 6}]))
+        for action in USER_FLOW:
+            await self.send(action, self.callback_update(user_id, action))
+
+    async def run_users(self, users, concurrency):
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def limited(user_id):
+            async with semaphore:
+                await self.user_session(user_id)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(limited(100_000 + index) for index in range(users)))
+        return time.perf_counter() - start
+
+    async def run_album_upload(self, admin_id, admin_name, photos):
+        await self.send('change_offers', self.callback_update(admin_id, 'change_offers', admin_name))
+        done = self.api.wait_for('sendMessage', lambda params: 'offer photos' in params.get('text', ''))
+        menu = self.api.wait_for('sendPhoto', lambda params: int(params.get('chat_id', 0)) == admin_id)
+        start = time.perf_counter()
+        for index in range(photos):
+            photo = [{'file_id': f'album-{index}', 'file_unique_id': f'album-{index}', 'width': 1280, 'height': 1280}]
+            await self.send('album_photo', self.message_update(admin_id, admin_name, media_group_id='album-1',
+                                                               photo=photo))
+        self.timings['album_upload'].append(await done - start)
+        # The non-blocking album handler finishes by sending the menu; let its state resolve
+        await menu
+        await asyncio.sleep(0.1)
+
+    async def run_broadcast(self, admin_id, admin_name):
+        await self.send('send_broadcast', self.callback_update(admin_id, 'send_broadcast', admin_name))
+        start = time.perf_counter()
+        await self.send('do_broadcast', self.message_update(admin_id, admin_name, text='Oferte noi!'))
+        await self.send('confirm_broadcast', self.callback_update(admin_id, 'confirm_broadcast', admin_name))
+        await self.main.broadcaster.task
+        elapsed = time.perf_counter() - start
+        self.timings['broadcast_total'].append(elapsed)
+        return self.main.broadcaster.state['sent'], elapsed
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def summarize(timings, wall_time):
+    results = {}
+    for name, values in timings.items():
+        results[name] = {
+            'count': len(values),
+            'throughput': len(values) / wall_time if wall_time else 0.0,
+            'p50_ms': statistics.median(values) * 1000,
+            'p95_ms': percentile(values, 0.95) * 1000,
+            'p99_ms': percentile(values, 0.99) * 1000,
+        }
+    return results
+
+
+async def run(args):
+    api = FakeBotAPI(latency=args.api_latency / 1000)
+    await api.start()
+    import main
+    from rate_limit import RateLimiter
+
+    worksheet = FakeWorksheet(args.sheets_latency / 1000)
+    main.sheets._worksheets[main.USERS_SHEET] = worksheet
+    main.sheets.limiter = RateLimiter(args.sheets_quota)
+    main.broadcaster.messages_per_second = args.broadcast_rate
+    main.broadcaster.progress_interval = 1
+    main.album_collector.quiet_period = 0.2
+
+    application = main.build_application(TOKEN, base_url=api.base_url, base_file_url=api.base_file_url)
+    await application.initialize()
+    await application.start()
+    simulator = Simulator(main, application, api)
+    admin_name = sorted(main.content_store.admins)[0]
+    try:
+        users_wall = await simulator.run_users(args.users, args.concurrency)
+        start = time.perf_counter()
+        await main.sync_once(main.user_registry, main.sheets, main.USERS_SHEET)
+        simulator.timings['registry_flush'].append(time.perf_counter() - start)
+        # What run_audience_loop does in the background; the broadcast handlers only read the index
+        start = time.perf_counter()
+        await main.refresh_audience()
+        simulator.timings['audience_refresh'].append(time.perf_counter() - start)
+        await simulator.run_album_upload(1, admin_name, args.album_photos)
+        sent, broadcast_wall = await simulator.run_broadcast(1, admin_name)
+    finally:
+        await application.stop()
+        await application.shutdown()
+        await api.stop()
+        main.sheets.close()
+
+    results = summarize(simulator.timings, users_wall)
+    # Throughput only means something for the user flow; for the broadcast it is messages per second
+    for name, row in results.items():
+        if name not in USER_FLOW and name != 'start':
+            row['throughput'] = 0.0
+    results['broadcast_total']['throughput'] = sent / broadcast_wall
+    print(f"users={args.users} concurrency={args.concurrency} api_latency={args.api_latency}ms "
+          f"sheets_latency={args.sheets_latency}ms wall={users_wall:.2f}s")
+    print(f"{'handler':<16}{'count':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, row in results.items():
+        print(f"{name:<16}{row['count']:>8}{row['throughput']:>10.1f}{row['p50_ms']:>10.2f}"
+              f"{row['p95_ms']:>10.2f}{row['p99_ms']:>10.2f}")
+    print(f"Bot API calls: {len(api.calls)}, Sheets calls: {dict(worksheet.calls)}")
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as file:
+            json.dump({'args': vars(args), 'results': results}, file, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--api-latency', type=float, default=30, help='fake Bot API latency in ms')
+    parser.add_argument('--sheets-latency', type=float, default=300, help='fake worksheet latency in ms')
+    parser.add_argument('--sheets-quota', type=int, default=60, help='Sheets calls allowed per minute')
+    parser.add_argument('--broadcast-rate', type=int, default=30, help='broadcast messages per second')
+    parser.add_argument('--album-photos', type=int, default=4)
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    with tempfile.TemporaryDirectory() as directory:
+        prepare_workdir(directory)
+        os.chdir(directory)
+        asyncio.run(run(args))
+        os.chdir(ROOT)
+
+
+if __name__ == '__main__':
+    main()
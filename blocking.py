@@ -0,0 +1,62 @@
+import asyncio
+import functools
+import logging
+import sys
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+io_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='blocking-io')
+
+
+async def run_blocking(func, *args, **kwargs):
+    """Runs a blocking filesystem call in the bounded I/O pool."""
+    return await asyncio.get_running_loop().run_in_executor(io_executor, functools.partial(func, *args, **kwargs))
+
+
+class LoopStallDetector:
+    """Debug aid that reports event loop stalls.
+
+    A heartbeat scheduled on the loop updates a timestamp every `interval`
+    seconds; a watchdog thread logs the loop thread's stack whenever the
+    heartbeat is late by more than `threshold` seconds.
+    """
+
+    def __init__(self, threshold: float, interval: float = 0.01):
+        self.threshold = threshold
+        self.interval = interval
+        self.stalls = 0
+        self._last_beat = time.monotonic()
+        self._loop = None
+        self._loop_thread_id = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._loop.call_soon(self._beat)
+        threading.Thread(target=self._watch, name='loop-stall-detector', daemon=True).start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _beat(self):
+        self._last_beat = time.monotonic()
+        if not self._stopped.is_set():
+            self._loop.call_later(self.interval, self._beat)
+
+    def _watch(self):
+        reported_beat = None
+        while not self._stopped.wait(self.threshold / 2):
+            beat = self._last_beat
+            lag = time.monotonic() - beat - self.interval
+            if lag < self.threshold or beat == reported_beat:
+                continue
+            reported_beat = beat
+            self.stalls += 1
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = ''.join(traceback.format_stack(frame)) if frame is not None else '<no frame>'
+            logger.warning(f"Event loop blocked for more than {lag * 1000:.0f} ms:\n{stack}")
@@ -0,0 +1,157 @@
+import asyncio
+import json
+import logging
+import os
+import time
+
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter
+
+from blocking import run_blocking
+from rate_limit import RateLimiter
+
+logger = logging.getLogger(__name__)
+
+
+class Broadcaster:
+    """Background broadcast engine.
+
+    Messages go out concurrently under Telegram's global limit, `RetryAfter`
+    pauses every sender, and progress is saved to `state_path` so an interrupted
+    broadcast resumes where it stopped.
+    """
+
+    def __init__(self, state_path: str, registry, messages_per_second: int = 30, concurrency: int = 20,
+                 max_retries: int = 3, progress_interval: float = 3):
+        self.state_path = state_path
+        self.registry = registry
+        self.messages_per_second = messages_per_second
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.progress_interval = progress_interval
+        self.state = None
+        self.task = None
+        self._resume_at = 0
+
+    @property
+    def running(self):
+        return self.task is not None and not self.task.done()
+
+    def _save_state(self, state):
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump(state, file, ensure_ascii=False)
+        os.replace(tmp_path, self.state_path)
+
+    def _snapshot(self):
+        return dict(self.state, done=list(self.state['done']))
+
+    async def start(self, bot, text, user_ids, admin_chat_id):
+        status = await bot.send_message(chat_id=admin_chat_id, text="Se pregătește trimiterea mesajului...")
+        self.state = {
+            'text': text,
+            'user_ids': sorted(user_ids),
+            'done': set(),
+            'sent': 0,
+            'failed': 0,
+            'blocked': 0,
+            'admin_chat_id': admin_chat_id,
+            'status_message_id': status.message_id,
+        }
+        await run_blocking(self._save_state, self._snapshot())
+        self.task = asyncio.create_task(self._run(bot))
+
+    async def resume(self, bot):
+        if self.running or not os.path.exists(self.state_path):
+            return False
+        with open(self.state_path, 'r', encoding='utf-8') as file:
+            state = json.load(file)
+        state['done'] = set(state['done'])
+        self.state = state
+        logger.info(f"Resuming broadcast at {len(state['done'])}/{len(state['user_ids'])} users")
+        self.task = asyncio.create_task(self._run(bot))
+        return True
+
+    async def _send(self, bot, limiter, user_id):
+        for attempt in range(self.max_retries + 1):
+            delay = self._resume_at - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await limiter.acquire()
+            try:
+                await bot.send_message(chat_id=user_id, text=self.state['text'])
+                return 'sent'
+            except RetryAfter as e:
+                self._resume_at = max(self._resume_at, time.monotonic() + e.retry_after)
+                logger.warning(f"Flood limit hit, pausing broadcast for {e.retry_after}s")
+            except Forbidden:
+                return 'blocked'
+            except BadRequest as e:
+                logger.warning(f"Could not send to {user_id}: {e}")
+                return 'failed'
+            except NetworkError as e:
+                if attempt == self.max_retries:
+                    logger.warning(f"Could not send to {user_id}: {e}")
+                    return 'failed'
+                await asyncio.sleep(2 ** attempt)
+        return 'failed'
+
+    def _progress_text(self, finished=False):
+        state = self.state
+        header = "Mesajul a fost trimis." if finished else "Se trimite mesajul..."
+        return (f"{header}\n"
+                f"Progres: {len(state['done'])}/{len(state['user_ids'])}\n"
+                f"Trimise: {state['sent']}, blocate: {state['blocked']}, eșuate: {state['failed']}")
+
+    async def _report(self, bot, finished=False):
+        try:
+            await bot.edit_message_text(chat_id=self.state['admin_chat_id'],
+                                        message_id=self.state['status_message_id'],
+                                        text=self._progress_text(finished))
+        except BadRequest as e:
+            if 'not modified' not in str(e):
+                logger.warning(f"Could not update broadcast status: {e}")
+        except NetworkError as e:
+            logger.warning(f"Could not update broadcast status: {e}")
+
+    async def _progress_loop(self, bot):
+        while True:
+            await asyncio.sleep(self.progress_interval)
+            await run_blocking(self._save_state, self._snapshot())
+            await self._report(bot)
+
+    async def _run(self, bot):
+        state = self.state
+        limiter = RateLimiter(self.messages_per_second, period=1)
+        queue = asyncio.Queue()
+        for user_id in state['user_ids']:
+            if user_id in state['done']:
+                continue
+            if self.registry.is_blocked(user_id):
+                state['done'].add(user_id)
+                state['blocked'] += 1
+                continue
+            queue.put_nowait(user_id)
+
+        async def worker():
+            while True:
+                try:
+                    user_id = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                result = await self._send(bot, limiter, user_id)
+                if result == 'blocked':
+                    self.registry.mark_blocked(user_id)
+                state[result] += 1
+                state['done'].add(user_id)
+
+        progress = asyncio.create_task(self._progress_loop(bot))
+        try:
+            await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+        except asyncio.CancelledError:
+            self._save_state(self._snapshot())
+            raise
+        finally:
+            progress.cancel()
+        await run_blocking(os.remove, self.state_path)
+        await self._report(bot, finished=True)
+        logger.info(f"Broadcast finished: {state['sent']} sent, {state['blocked']} blocked, {state['failed']} failed")
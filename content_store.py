@@ -0,0 +1,49 @@
+import os
+import tempfile
+
+
+class ContentStore:
+    """In-memory copy of the editable text files.
+
+    Files are read once at startup and served from RAM afterwards. `save()`
+    writes through atomically and bumps `version` so other caches can tell
+    when content changed.
+    """
+
+    def __init__(self, file_paths, admins_path: str = 'admins.txt'):
+        self.admins_path = admins_path
+        self.contents = {}
+        self.versions = {}
+        self.version = 0
+        self.admins = set()
+        for file_path in file_paths:
+            self.load(file_path)
+
+    def load(self, file_path):
+        with open(file_path, 'r', encoding='utf-8') as file:
+            self._set(file_path, file.read())
+
+    def _set(self, file_path, content):
+        self.contents[file_path] = content
+        self.version += 1
+        self.versions[file_path] = self.version
+        if file_path == self.admins_path:
+            self.admins = {line.strip() for line in content.splitlines() if line.strip()}
+
+    def get(self, file_path):
+        return self.contents[file_path]
+
+    def is_admin(self, username):
+        return username in self.admins
+
+    def save(self, file_path, content):
+        directory = os.path.dirname(os.path.abspath(file_path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as file:
+                file.write(content)
+            os.replace(tmp_path, file_path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        self._set(file_path, content)
@@ -0,0 +1,87 @@
+import asyncio
+import logging
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Telegram shows photos at most 1280 px on the longest side
+MAX_SIDE = 1280
+QUALITY = 85
+
+_executor = None
+
+
+def optimize_image(source_path: str, target_path: str, max_side: int = MAX_SIDE, quality: int = QUALITY):
+    """Fixes orientation, downscales, recompresses and strips metadata.
+
+    Returns (bytes_before, bytes_after). The original bytes are kept (or copied
+    to `target_path`) when recompressing would not make it smaller.
+    """
+    # Imported here: this runs in the pool processes, the bot process never needs Pillow
+    from PIL import Image, ImageOps
+
+    before = os.path.getsize(source_path)
+    with Image.open(source_path) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+        # Several worker processes may optimize the same file at startup
+        tmp_path = f"{target_path}.{os.getpid()}.tmp"
+        image.save(tmp_path, 'JPEG', quality=quality, optimize=True, progressive=True)
+    after = os.path.getsize(tmp_path)
+    if after >= before:
+        if source_path == target_path:
+            os.unlink(tmp_path)
+            return before, before
+        shutil.copyfile(source_path, tmp_path)
+        after = before
+    os.replace(tmp_path, target_path)
+    return before, after
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=2)
+    return _executor
+
+
+async def optimize_files(paths):
+    """Optimizes the given files in place in the process pool and logs the savings."""
+    loop = asyncio.get_running_loop()
+    results = await asyncio.gather(*(loop.run_in_executor(_get_executor(), optimize_image, path, path)
+                                     for path in paths), return_exceptions=True)
+    total_before = total_after = 0
+    for path, result in zip(paths, results):
+        if isinstance(result, BaseException):
+            logger.warning(f"Could not optimize {path}: {result}")
+            continue
+        before, after = result
+        total_before += before
+        total_after += after
+        logger.info(f"Optimized {path}: {before} -> {after} bytes")
+    if total_before:
+        logger.info(f"Image optimization saved {total_before - total_after} of {total_before} bytes "
+                    f"({100 * (total_before - total_after) / total_before:.0f}%)")
+    return total_before, total_after
+
+
+async def optimize_copy(source_path: str, target_path: str):
+    """Writes an optimized copy of `source_path` unless an up-to-date one exists."""
+    if os.path.exists(target_path) and os.path.getmtime(target_path) >= os.path.getmtime(source_path):
+        return target_path
+    loop = asyncio.get_running_loop()
+    before, after = await loop.run_in_executor(_get_executor(), optimize_image, source_path, target_path)
+    logger.info(f"Optimized {source_path}: {before} -> {after} bytes")
+    return target_path
+
+
+def shutdown():
+    global _executor
+    if _executor is not None:
+        # Waiting lets pool processes that are still starting up exit cleanly
+        _executor.shutdown(wait=True, cancel_futures=True)
+        _executor = None
@@ -1,54 +1,170 @@
+import asyncio
+import html
 import logging
 import os
 import re
 
-import gspread
-from oauth2client.service_account import ServiceAccountCredentials
 from telegram import (ReplyKeyboardRemove, Update,
-                      InlineKeyboardButton, InlineKeyboardMarkup, InputMediaPhoto)
-from telegram.ext import (Application, CallbackQueryHandler, CommandHandler,
-                          ContextTypes, ConversationHandler, MessageHandler, filters)
-from telegram.ext import PicklePersistence
-
-
-def connect_to_google_sheets(sheet_name):
-    scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
-    creds = ServiceAccountCredentials.from_json_keyfile_name("credentials.json", scope)
-    client = gspread.authorize(creds)
-    sheet = client.open(sheet_name).sheet1
-    return sheet
+                      InlineKeyboardButton, InlineKeyboardMarkup, InputMediaPhoto,
+                      InlineQueryResultArticle, InputTextMessageContent)
+from telegram.error import BadRequest
+from telegram.ext import (Application, CommandHandler,
+                          ContextTypes, ConversationHandler, InlineQueryHandler, MessageHandler, filters)
+
+from album_collector import AlbumCollector
+from audience import AudienceIndex, describe_segment, parse_segment, run_save_loop
+from blocking import LoopStallDetector, run_blocking
+from broadcast import Broadcaster
+from content_store import ContentStore
+import image_pipeline
+from image_pipeline import optimize_copy, optimize_files
+from media_cache import MediaCache
+from metrics import InstrumentedRequest, SlowUpdateProfiler, instrument, metrics, serve_metrics, startup
+from rate_limit import FloodControl, parse_limits
+from router import CallbackRouter, Route, RouteHandler
+from search_index import SearchIndex
+from sheets import SheetsClient
+from sqlite_persistence import SQLitePersistence
+from user_registry import UserRegistry, run_sync_loop, sync_once
+from workers import WorkerPool
+
+startup.mark('imports')
+
+USERS_SHEET = "DrinkStock"
+
+# Set by workers.py in each worker process; content files and the SQLite store are shared,
+# the per-process state files below get a per-worker name
+WORKER_ID = os.environ.get('WORKER_ID')
+WORKER_COUNT = int(os.environ.get('WORKER_COUNT', '1'))
+
+def state_file(file_name: str, worker_id=WORKER_ID) -> str:
+    if worker_id is None:
+        return file_name
+    base, extension = os.path.splitext(file_name)
+    return f"{base}.worker{worker_id}{extension}"
+
+sheets = SheetsClient("credentials.json", requests_per_minute=max(1, 60 // WORKER_COUNT))
+user_registry = UserRegistry(state_file('users.json'))
+# Telegram's ~30 messages/s limit is per bot, so the workers split it like the Sheets quota
+broadcaster = Broadcaster(state_file('broadcast_state.json'), user_registry,
+                          messages_per_second=max(1, 30 // WORKER_COUNT))
+media_cache = MediaCache(state_file('media_cache.json'))
+album_collector = AlbumCollector()
+audience = AudienceIndex(state_file('audience_index.json'))
+audience.merge_registry(user_registry.users)
 
 def save_user_info(user_id, first_name, last_name, username, language):
-    sheet = connect_to_google_sheets("DrinkStock")
-    existing_data = sheet.get_all_values()
-    next_row = len(existing_data) + 1
-    sheet.append_row([user_id, first_name, last_name, username, language], table_range=f"A{next_row}:E{next_row}")
+    info = user_registry.record(user_id, first_name, last_name, username, language)
+    audience.observe(user_id, language, info['first_seen'], info['last_seen'])
 
 logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
                     level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-CONTACT, BACK_TO_START, MAP, OFFER, REVIEW, COCKTAIL_RECIPE, CHANGE_ADDRESSES, CHANGE_ADMINS, CHANGE_COCKTAIL_RECIPE, CHANGE_CONTACT_INFO, CHANGE_START_MESSAGE, CHANGE_REVIEW, CHANGE_OFFERS, CHANGE_RECIPE_PHOTOS, SEND_BROADCAST = range(15)
+content_store = ContentStore(['start_text.html', 'map_locations.html', 'contact_info.html', 'review.html',
+                              'cocktail_recipe.html', 'admins.txt'])
+startup.mark('state files')
+
+CONTACT, BACK_TO_START, MAP, OFFER, REVIEW, COCKTAIL_RECIPE, CHANGE_ADDRESSES, CHANGE_ADMINS, CHANGE_COCKTAIL_RECIPE, CHANGE_CONTACT_INFO, CHANGE_START_MESSAGE, CHANGE_REVIEW, CHANGE_OFFERS, CHANGE_RECIPE_PHOTOS, SEND_BROADCAST, CONFIRM_BROADCAST = range(16)
+
+# Set by workers.py so the other worker processes pick up edits made in this one
+change_publisher = None
+
+def publish_change(kind: str, key: str):
+    if change_publisher is not None:
+        change_publisher(kind, key)
+
+async def apply_change(kind: str, key: str):
+    if kind == 'content':
+        await run_blocking(content_store.load, key)
+    elif kind == 'photos':
+        await run_blocking(invalidate_photos, key)
+    logger.info(f"Reloaded {kind} {key} changed by another worker")
 
 def read_file(file_name: str) -> str:
     with open(file_name, 'r', encoding='utf-8') as file:
         return file.read()
 
-def read_file_lines(file_path):
-    with open(file_path, 'r') as file:
-        return [line.strip() for line in file if line.strip()]
-
 def save_new_content(file_path: str, content: str):
     url_pattern = re.compile(r'(.*?)(https?://\S+)\)')
     content = url_pattern.sub(r'<a href="\2">\1</a>', content)
     content = content.replace(' (', '')
-    with open(file_path, 'w', encoding='utf-8') as file:
-        file.write(content)
+    content_store.save(file_path, content)
+
+async def handle_save_album(update: Update, context: ContextTypes.DEFAULT_TYPE, photos_dir: str, state: int,
+                            done_text: str) -> int:
+    # Registered with block=False: later photos of the album reach collect_album_photo meanwhile
+    if not album_collector.add(update.message):
+        return state
+    messages = await album_collector.wait(update.message)
+    # Not pre-seeded with the received file_ids: those point at the unoptimized originals, so the
+    # first send uploads the optimized files and send_photos caches the ids Telegram returns for them
+    await album_collector.replace_directory(context.bot, messages, photos_dir, process=optimize_files)
+    await run_blocking(invalidate_photos, photos_dir)
+    publish_change('photos', photos_dir)
+    await update.message.reply_text(done_text)
+    return await start(update, context)
+
+async def collect_album_photo(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    if album_collector.is_collecting(update.message):
+        album_collector.add(update.message)
+
+# Switched to the optimized copy once warm_up has produced it
+logo_path = 'logo.jpg'
+
+async def prepare_logo() -> None:
+    global logo_path
+    try:
+        logo_path = await optimize_copy('logo.jpg', 'logo.optimized.jpg')
+    except Exception as e:
+        logger.warning(f"Could not optimize logo.jpg: {e}")
+
+async def send_cached(photo_paths: list, send):
+    # Cached file_ids are rejected after a bot token change or with a stale media_cache.json;
+    # drop them and upload the files once more
+    photos = [await run_blocking(media_cache.photo, path) for path in photo_paths]
+    try:
+        return await send(photos)
+    except BadRequest as e:
+        cached = [path for path, photo in zip(photo_paths, photos) if isinstance(photo, str)]
+        if not cached or 'file' not in str(e).lower():
+            raise
+        logger.warning(f"Telegram rejected cached file_ids for {cached}: {e}")
+        for path in cached:
+            await run_blocking(media_cache.forget, path)
+        return await send([await run_blocking(media_cache.photo, path) for path in photo_paths])
+
+async def reply_logo(message, caption: str, reply_markup):
+    photo_path = logo_path
+    sent = await send_cached([photo_path], lambda photos: message.reply_photo(
+        photo=photos[0],
+        caption=caption,
+        parse_mode='HTML',
+        reply_markup=reply_markup
+    ))
+    await run_blocking(media_cache.remember_message, photo_path, sent)
+
+async def send_photos(bot, chat_id: int, photo_paths: list):
+    messages = await send_cached(photo_paths, lambda photos: bot.send_media_group(
+        chat_id=chat_id, media=[InputMediaPhoto(photo) for photo in photos]))
+    for photo, message in zip(photo_paths, messages):
+        await run_blocking(media_cache.remember_message, photo, message)
+
+def list_photos(photos_dir: str) -> list:
+    # Resolved once: after an album swap these paths keep pointing at the retained previous version
+    real_dir = os.path.realpath(photos_dir)
+    return [os.path.join(real_dir, file) for file in sorted(os.listdir(real_dir))
+            if file.endswith(('jpg', 'jpeg', 'png'))]
+
+def invalidate_photos(photos_dir: str):
+    # Photos are cached under their resolved path inside <photos_dir>.versions
+    media_cache.invalidate_dir(photos_dir)
+    media_cache.invalidate_dir(os.path.realpath(f"{photos_dir}.versions"))
 
 async def handle_change(update: Update, context: ContextTypes.DEFAULT_TYPE, file_path: str, prompt: str,
                         next_state: int) -> int:
     await update.callback_query.answer()
-    current_content = read_file(file_path)
+    current_content = content_store.get(file_path)
     keyboard = [[InlineKeyboardButton("Înapoi", callback_data='back')]]
     reply_markup = InlineKeyboardMarkup(keyboard)
     await update.callback_query.message.reply_text(
@@ -60,7 +176,8 @@ async def handle_change(update: Update, context: ContextTypes.DEFAULT_TYPE, file
 
 async def handle_save(update: Update, context: ContextTypes.DEFAULT_TYPE, file_path: str) -> int:
     new_content = update.message.text
-    save_new_content(file_path, new_content)
+    await run_blocking(save_new_content, file_path, new_content)
+    publish_change('content', file_path)
     await update.message.reply_text("Content updated successfully.")
     return await start(update, context)
 
@@ -69,8 +186,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     save_user_info(user.id, user.first_name, user.last_name or '', user.username or 'N/A', user.language_code)
     logger.info(f"User Info Saved: ID={user.id}, Name={user.first_name} {user.last_name or ''}, "
                 f"Username={user.username or 'N/A'}, Language={user.language_code}")
-    admins = read_file_lines('admins.txt')
-    is_admin = user.username in admins
+    is_admin = content_store.is_admin(user.username)
     keyboard = [
         [InlineKeyboardButton('Harta magazinelor', callback_data='map'),
          InlineKeyboardButton('Oferta lunii', callback_data='offer')],
@@ -89,14 +205,9 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         keyboard.append([InlineKeyboardButton('Schimba poze rețete cocktail', callback_data='change_recipe_photos')])
         keyboard.append([InlineKeyboardButton('Trimite mesaj tuturor', callback_data='send_broadcast')])
     reply_markup = InlineKeyboardMarkup(keyboard)
-    start_text = read_file('start_text.html')
+    start_text = content_store.get('start_text.html')
     if update.message:
-        await update.message.reply_photo(
-            photo=open('logo.jpg', 'rb'),
-            caption=start_text,
-            parse_mode='HTML',
-            reply_markup=reply_markup
-        )
+        await reply_logo(update.message, start_text, reply_markup)
     else:
         await update.callback_query.answer()
         await handle_back(update, context)
@@ -131,30 +242,8 @@ async def change_recipe_photos(update: Update, context: ContextTypes.DEFAULT_TYP
     return CHANGE_RECIPE_PHOTOS
 
 async def save_new_recipe_photos(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    recipe_photos_dir = 'recipes'
-    if update.message.media_group_id:
-        if update.message.media_group_id not in context.bot_data:
-            if not os.path.exists(recipe_photos_dir):
-                os.makedirs(recipe_photos_dir)
-            for file in os.listdir(recipe_photos_dir):
-                file_path = os.path.join(recipe_photos_dir, file)
-                if os.path.isfile(file_path):
-                    os.unlink(file_path)
-            context.bot_data[update.message.media_group_id] = []
-        context.bot_data[update.message.media_group_id].append(update.message)
-        # Adjust the number as needed (e.g., 2 for 2 photos)
-        if len(context.bot_data[update.message.media_group_id]) == 2:
-            for message in context.bot_data[update.message.media_group_id]:
-                if message.photo:
-                    highest_quality_photo = message.photo[-1]
-                    file_id = highest_quality_photo.file_id
-                    new_file = await context.bot.get_file(file_id)
-                    new_file_path = os.path.join(recipe_photos_dir, f"{file_id}.jpg")
-                    await new_file.download_to_drive(new_file_path)
-            del context.bot_data[update.message.media_group_id]
-            await update.message.reply_text("New recipe photos have been updated successfully.")
-            return await start(update, context)
-    return CHANGE_RECIPE_PHOTOS
+    return await handle_save_album(update, context, 'recipes', CHANGE_RECIPE_PHOTOS,
+                                   "New recipe photos have been updated successfully.")
 
 async def save_new_cocktail_recipe(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     return await handle_save(update, context, 'cocktail_recipe.html')
@@ -182,7 +271,7 @@ async def save_new_review(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 
 async def contact(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     await update.callback_query.answer()
-    contact_info = read_file('contact_info.html')
+    contact_info = content_store.get('contact_info.html')
     keyboard = [[InlineKeyboardButton("Înapoi", callback_data='back')]]
     reply_markup = InlineKeyboardMarkup(keyboard)
     await update.callback_query.message.reply_text(contact_info, parse_mode='HTML', reply_markup=reply_markup)
@@ -190,7 +279,7 @@ async def contact(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
 
 async def map_locations(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     await update.callback_query.answer()
-    districts_info = read_file('map_locations.html')
+    districts_info = content_store.get('map_locations.html')
     keyboard = [[InlineKeyboardButton("Înapoi", callback_data='back')]]
     reply_markup = InlineKeyboardMarkup(keyboard)
     await update.callback_query.message.reply_text(districts_info, parse_mode='HTML', reply_markup=reply_markup)
@@ -198,10 +287,8 @@ async def map_locations(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
 
 async def offer(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     offer_photos_dir = 'offers'
-    offer_photos = [os.path.join(offer_photos_dir, file) for file in os.listdir(offer_photos_dir) if
-                    file.endswith(('jpg', 'jpeg', 'png'))]
-    media = [InputMediaPhoto(open(photo, 'rb')) for photo in offer_photos]
-    await context.bot.send_media_group(chat_id=update.callback_query.from_user.id, media=media)
+    offer_photos = await run_blocking(list_photos, offer_photos_dir)
+    await send_photos(context.bot, update.callback_query.from_user.id, offer_photos)
     keyboard = [[InlineKeyboardButton("Înapoi", callback_data='back')]]
     reply_markup = InlineKeyboardMarkup(keyboard)
     await update.callback_query.message.reply_text("Acestea sunt ofertele lunii! Apasă 'Înapoi' pentru a reveni.",
@@ -218,75 +305,82 @@ async def change_offers(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
     )
     return CHANGE_OFFERS
 
+async def refresh_audience():
+    # Only rows appended since the last refresh are read from the sheet
+    try:
+        await audience.refresh(sheets, USERS_SHEET)
+    except Exception as e:
+        logger.warning(f"Could not read new users from Google Sheets: {e}")
+    # Activity of users handled by the other workers is only in their registry files
+    for worker_id in range(WORKER_COUNT if WORKER_ID is not None else 0):
+        if str(worker_id) != WORKER_ID:
+            registry = await run_blocking(UserRegistry, state_file('users.json', worker_id))
+            audience.merge_registry(registry.users)
+
+async def run_audience_loop(interval: float = 60):
+    # Kept current in the background so the broadcast handlers never wait on Google Sheets
+    while True:
+        await refresh_audience()
+        await asyncio.sleep(interval)
+
+def broadcast_audience(segment: dict) -> set:
+    # Users who blocked the bot are skipped by the broadcaster, so they are not counted either
+    return {user_id for user_id in audience.select(**segment) if not user_registry.is_blocked(user_id)}
+
 async def send_broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     await update.callback_query.answer()
+    context.user_data.pop('pending_broadcast', None)
+    languages = ', '.join(f"{language}: {count}" for language, count in audience.language_counts()[:5])
     keyboard = [[InlineKeyboardButton("Înapoi", callback_data='back')]]
     reply_markup = InlineKeyboardMarkup(keyboard)
     await update.callback_query.message.reply_text(
-        "Trimite mesajul pe care vrei să-l trimiți tuturor utilizatorilor.",
+        f"Public total: {len(audience.users)} utilizatori ({languages}).\n\n"
+        "Trimite mesajul pe care vrei să-l trimiți. Pentru a alege publicul, începe mesajul cu o linie "
+        "de filtre, de exemplu:\nlang=ro activ=30 nou=2024-01-01..2024-03-31",
         reply_markup=reply_markup
     )
     return SEND_BROADCAST
 
 async def do_broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    message = update.message.text
-    # Load all user IDs from Google Sheets
-    sheet = connect_to_google_sheets("DrinkStock")
-    users = sheet.get_all_values()
-    user_ids = set(row[0] for row in users if row and row[0].isdigit())
-    count = 0
-    for user_id in user_ids:
-        try:
-            await context.bot.send_message(chat_id=int(user_id), text=message)
-            count += 1
-        except Exception as e:
-            logger.warning(f"Could not send to {user_id}: {e}")
-    await update.message.reply_text(f"Mesajul a fost trimis la {count} utilizatori.")
+    if broadcaster.running:
+        await update.message.reply_text("Un alt mesaj este încă în curs de trimitere.")
+        return await start(update, context)
+    try:
+        segment, message = parse_segment(update.message.text)
+    except ValueError as e:
+        await update.message.reply_text(f"Filtru invalid: {e}")
+        return SEND_BROADCAST
+    user_ids = broadcast_audience(segment)
+    if not user_ids:
+        await update.message.reply_text("Niciun utilizator nu corespunde filtrului. Trimite alt mesaj.")
+        return SEND_BROADCAST
+    context.user_data['pending_broadcast'] = {'text': message, 'segment': segment}
+    keyboard = [[InlineKeyboardButton("Trimite", callback_data='confirm_broadcast')],
+                [InlineKeyboardButton("Înapoi", callback_data='back')]]
+    reply_markup = InlineKeyboardMarkup(keyboard)
+    await update.message.reply_text(
+        f"Mesajul va fi trimis la {len(user_ids)} utilizatori ({describe_segment(segment)}).",
+        reply_markup=reply_markup
+    )
+    return CONFIRM_BROADCAST
+
+async def confirm_broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    await update.callback_query.answer()
+    pending = context.user_data.pop('pending_broadcast', None)
+    if broadcaster.running:
+        await update.callback_query.message.reply_text("Un alt mesaj este încă în curs de trimitere.")
+    elif pending is not None:
+        user_ids = broadcast_audience(pending['segment'])
+        await broadcaster.start(context.bot, pending['text'], user_ids, update.callback_query.message.chat_id)
     return await start(update, context)
 
 async def save_new_offers(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    offer_photos_dir = 'offers'
-
-    # First photo in the group: clear the directory
-    if update.message.media_group_id:
-        if update.message.media_group_id not in context.bot_data:
-            # Ensure the directory exists
-            if not os.path.exists(offer_photos_dir):
-                os.makedirs(offer_photos_dir)
-
-            # Delete old photos
-            for file in os.listdir(offer_photos_dir):
-                file_path = os.path.join(offer_photos_dir, file)
-                if os.path.isfile(file_path):
-                    os.unlink(file_path)
-
-            # Initialize the media group storage
-            context.bot_data[update.message.media_group_id] = []
-
-        # Store the photo in bot_data
-        context.bot_data[update.message.media_group_id].append(update.message)
-
-        # Get all photos after short delay to ensure we have received them all
-        if len(context.bot_data[update.message.media_group_id]) == 2:  # Assuming 2 photos
-            # Save all photos
-            for message in context.bot_data[update.message.media_group_id]:
-                if message.photo:
-                    highest_quality_photo = message.photo[-1]
-                    file_id = highest_quality_photo.file_id
-                    new_file = await context.bot.get_file(file_id)
-                    new_file_path = os.path.join(offer_photos_dir, f"{file_id}.jpg")
-                    await new_file.download_to_drive(new_file_path)
-
-            # Clean up
-            del context.bot_data[update.message.media_group_id]
-            await update.message.reply_text("New offer photos have been updated successfully.")
-            return await start(update, context)
-
-    return CHANGE_OFFERS  # Stay in the same st
+    return await handle_save_album(update, context, 'offers', CHANGE_OFFERS,
+                                   "New offer photos have been updated successfully.")
 
 async def review(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     await update.callback_query.answer()
-    review_info = read_file('review.html')
+    review_info = content_store.get('review.html')
     keyboard = [[InlineKeyboardButton("Înapoi", callback_data='back')]]
     reply_markup = InlineKeyboardMarkup(keyboard)
     await update.callback_query.message.reply_text(review_info, parse_mode='HTML', reply_markup=reply_markup)
@@ -295,11 +389,10 @@ async def review(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
 async def cocktail_recipe(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     await update.callback_query.answer()
     receipts_dir = 'recipes'
-    receipt_photos = [os.path.join(receipts_dir, file) for file in os.listdir(receipts_dir) if file.endswith(('jpg', 'jpeg', 'png'))]
+    receipt_photos = await run_blocking(list_photos, receipts_dir)
     if receipt_photos:
-        media = [InputMediaPhoto(open(photo, 'rb')) for photo in receipt_photos]
-        await context.bot.send_media_group(chat_id=update.callback_query.from_user.id, media=media)
-    recipe_info = read_file('cocktail_recipe.html')
+        await send_photos(context.bot, update.callback_query.from_user.id, receipt_photos)
+    recipe_info = content_store.get('cocktail_recipe.html')
     keyboard = [[InlineKeyboardButton("Înapoi", callback_data='back')]]
     reply_markup = InlineKeyboardMarkup(keyboard)
     await update.callback_query.message.reply_text(recipe_info, parse_mode='HTML', reply_markup=reply_markup)
@@ -308,8 +401,7 @@ async def cocktail_recipe(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 async def handle_back(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     await update.callback_query.answer()
     user = update.callback_query.from_user
-    admins = read_file_lines('admins.txt')
-    is_admin = user.username in admins
+    is_admin = content_store.is_admin(user.username)
     keyboard = [
         [InlineKeyboardButton('Harta magazinelor', callback_data='map'),
          InlineKeyboardButton('Oferta lunii', callback_data='offer')],
@@ -328,7 +420,7 @@ async def handle_back(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int
         keyboard.append([InlineKeyboardButton('Schimba poze rețete cocktail', callback_data='change_recipe_photos')])
         keyboard.append([InlineKeyboardButton('Trimite mesaj tuturor', callback_data='send_broadcast')])
     reply_markup = InlineKeyboardMarkup(keyboard)
-    start_text = read_file('start_text.html')
+    start_text = content_store.get('start_text.html')
     if update.callback_query.message.photo:
         await update.callback_query.message.edit_caption(
             caption=start_text,
@@ -336,126 +428,291 @@ async def handle_back(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int
             reply_markup=reply_markup
         )
     else:
-        await update.callback_query.message.reply_photo(
-            photo=open('logo.jpg', 'rb'),
-            caption=start_text,
-            parse_mode='HTML',
-            reply_markup=reply_markup
-        )
+        await reply_logo(update.callback_query.message, start_text, reply_markup)
     return BACK_TO_START
 
 
-def main() -> None:
-    API_KEY = read_file('.env')
-
-    # Delete the corrupted persistence file if it exists
-    if os.path.exists("conversation_states.pkl"):
-        os.remove("conversation_states.pkl")
-
-    # Create persistence object with correct store_data configuration
-    persistence = PicklePersistence(
-        filepath="conversation_states.pkl",
-        store_data=None  # Use default settings
-    )
-
-    # Build application with persistence
-    application = Application.builder().token(API_KEY).persistence(persistence).build()
+def render_inline_results(entries) -> list:
+    results = []
+    for position, entry in enumerate(entries):
+        name = html.escape(entry.name)
+        text = f'<a href="{html.escape(entry.link)}">{name}</a>' if entry.link else name
+        if entry.kind == 'store':
+            place = ', '.join(part for part in (entry.sector and f"Sectorul {entry.sector}", entry.city) if part)
+            text = f"📍 {text}\n{html.escape(place)}"
+        else:
+            place = 'Rețetă cocktail'
+        results.append(InlineQueryResultArticle(
+            id=str(position),
+            title=entry.name,
+            description=place,
+            input_message_content=InputTextMessageContent(text, parse_mode='HTML')
+        ))
+    return results
+
+# Rebuilt from the content store whenever map_locations.html or cocktail_recipe.html is saved
+search_index = SearchIndex(content_store, 'map_locations.html', 'cocktail_recipe.html', render_inline_results)
+
+async def inline_search(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    await update.inline_query.answer(search_index.search(update.inline_query.query), cache_time=300)
+
+
+background_tasks = []
+background_servers = []
+background_stoppers = []
+
+def hash_photos(photos_dirs) -> int:
+    # An album that was never uploaded has no directory yet
+    paths = [logo_path] + [path for photos_dir in photos_dirs if os.path.isdir(photos_dir)
+                           for path in list_photos(photos_dir)]
+    for path in paths:
+        media_cache.content_hash(path)
+    return len(paths)
+
+async def warm_up(application: Application) -> None:
+    # Cold costs the first users would otherwise pay, done once updates are already being served
+    while not application.running:
+        await asyncio.sleep(0.01)
+    startup.mark('start updates')
+    startup.report()
+    # Each phase logs its own failure so the later ones still run
+    with startup.measure('search index'):
+        try:
+            search_index.refresh()
+        except Exception as e:
+            logger.warning(f"Search index warm-up failed: {e}")
+    # Before hashing, so the hash is taken of the logo reply_logo actually sends
+    with startup.measure('logo'):
+        await prepare_logo()
+    with startup.measure('media hashes'):
+        try:
+            await run_blocking(hash_photos, ['offers', 'recipes'])
+        except Exception as e:
+            logger.warning(f"Media hash warm-up failed: {e}")
+    with startup.measure('sheets session'):
+        try:
+            await sheets.worksheet(USERS_SHEET)
+        except Exception as e:
+            logger.warning(f"Google Sheets warm-up failed: {e}")
+
+async def post_init(application: Application) -> None:
+    startup.mark('initialize')
+    background_tasks.append(asyncio.create_task(sheets.refresh_loop()))
+    background_tasks.append(asyncio.create_task(run_sync_loop(user_registry, sheets, USERS_SHEET)))
+    background_tasks.append(asyncio.create_task(run_save_loop(audience)))
+    background_tasks.append(asyncio.create_task(run_audience_loop()))
+    await broadcaster.resume(application.bot)
+    if os.environ.get('METRICS_PORT'):
+        background_servers.append(await serve_metrics(os.environ.get('METRICS_HOST', '127.0.0.1'),
+                                                      int(os.environ['METRICS_PORT']) + int(WORKER_ID or 0)))
+    if os.environ.get('LOOP_STALL_MS'):
+        stall_detector = LoopStallDetector(float(os.environ['LOOP_STALL_MS']) / 1000)
+        stall_detector.start()
+        background_stoppers.append(stall_detector.stop)
+    if os.environ.get('PROFILE_SLOW_UPDATES_MS'):
+        metrics.profiler = SlowUpdateProfiler(float(os.environ['PROFILE_SLOW_UPDATES_MS']) / 1000)
+    background_tasks.append(asyncio.create_task(warm_up(application)))
+    startup.mark('post_init')
+
+async def post_shutdown(application: Application) -> None:
+    if broadcaster.running:
+        broadcaster.task.cancel()
+    for task in background_tasks:
+        task.cancel()
+    background_tasks.clear()
+    for server in background_servers:
+        server.close()
+    background_servers.clear()
+    for stop in background_stoppers:
+        stop()
+    background_stoppers.clear()
+    try:
+        await sync_once(user_registry, sheets, USERS_SHEET)
+    except Exception as e:
+        logger.warning(f"Final user registry sync failed: {e}")
+    await run_blocking(audience.save, audience.snapshot())
+    sheets.close()
+    image_pipeline.shutdown()
+
+
+# Menu routes include the entry point (None); with allow_reentry they are therefore reachable from
+# every state, see CallbackRouter
+MENU_STATES = frozenset({None, BACK_TO_START})
+ALL_STATES = frozenset({None}) | frozenset(range(CONFIRM_BROADCAST + 1))
+
+CALLBACK_ROUTES = {
+    'contact': Route(contact, MENU_STATES),
+    'map': Route(map_locations, MENU_STATES),
+    'offer': Route(offer, MENU_STATES, block=False),
+    'review': Route(review, MENU_STATES),
+    'cocktail': Route(cocktail_recipe, MENU_STATES, block=False),
+    'back': Route(handle_back, ALL_STATES, block=False),
+    'change_addresses': Route(change_addresses, MENU_STATES, admin_only=True),
+    'change_admins': Route(change_admins, MENU_STATES, admin_only=True),
+    'change_cocktail_recipe': Route(change_cocktail_recipe, MENU_STATES, admin_only=True),
+    'change_contact_info': Route(change_contact_info, MENU_STATES, admin_only=True),
+    'change_start_message': Route(change_start_message, MENU_STATES, admin_only=True),
+    'change_review': Route(change_review, MENU_STATES, admin_only=True),
+    'change_offers': Route(change_offers, MENU_STATES, admin_only=True),
+    'change_recipe_photos': Route(change_recipe_photos, MENU_STATES, admin_only=True),
+    'send_broadcast': Route(send_broadcast, MENU_STATES, admin_only=True),
+    'confirm_broadcast': Route(confirm_broadcast, frozenset({CONFIRM_BROADCAST}), admin_only=True),
+}
+
+# Per-user (burst, seconds) for the actions that upload photos or redraw the menu;
+# override with e.g. FLOOD_LIMITS="offer=2/60,back=5/10". The photo-sending routes are non-blocking,
+# so taps arriving while one still runs get the busy toast from the WAITING state at once
+FLOOD_LIMITS = {
+    'offer': (2, 30),
+    'cocktail': (2, 30),
+    'map': (3, 10),
+    'back': (5, 10),
+}
+FLOOD_LIMITS.update(parse_limits(os.environ.get('FLOOD_LIMITS', '')))
+
+flood_control = FloodControl(FLOOD_LIMITS)
+
+callback_router = CallbackRouter({data: route._replace(callback=instrument(route.callback))
+                                  for data, route in CALLBACK_ROUTES.items()}, content_store.is_admin,
+                                 flood_control=flood_control, busy_text="Vă rugăm așteptați câteva secunde…")
+
+
+async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    await update.message.reply_text('Conversation cancelled.', reply_markup=ReplyKeyboardRemove())
+
+def instrument_handlers(conv_handler: ConversationHandler) -> None:
+    # Routes are instrumented in callback_router; everything else gets a timing wrapper here
+    handlers = list(conv_handler.entry_points) + list(conv_handler.fallbacks)
+    for state_handlers in conv_handler.states.values():
+        handlers.extend(state_handlers)
+    for handler in handlers:
+        if not isinstance(handler, RouteHandler):
+            handler.callback = instrument(handler.callback)
+
+
+ALLOWED_UPDATES = [Update.MESSAGE, Update.CALLBACK_QUERY, Update.INLINE_QUERY]
+
+
+def build_application(token: str, persistence_path: str = "conversation_states.sqlite3",
+                      base_url: str = None, base_file_url: str = None) -> Application:
+    # Conversation states survive restarts; only changed rows are written on each flush
+    persistence = SQLitePersistence(filepath=persistence_path)
+
+    builder = (Application.builder().token(token).persistence(persistence)
+               .request(InstrumentedRequest(connection_pool_size=256))
+               .post_init(post_init).post_shutdown(post_shutdown))
+    if base_url:
+        builder = builder.base_url(base_url)
+    if base_file_url:
+        builder = builder.base_file_url(base_file_url)
+    concurrent_updates = int(os.environ.get('CONCURRENT_UPDATES', '0'))
+    if concurrent_updates:
+        builder = builder.concurrent_updates(concurrent_updates)
+    application = builder.build()
 
     # Define the conversation handler with states and fallbacks
     conv_handler = ConversationHandler(
         entry_points=[
             CommandHandler('start', start),
-            CallbackQueryHandler(contact, pattern='contact'),
-            CallbackQueryHandler(map_locations, pattern='map'),
-            CallbackQueryHandler(offer, pattern='offer'),
-            CallbackQueryHandler(review, pattern='review'),
-            CallbackQueryHandler(handle_back, pattern='back'),
-            CallbackQueryHandler(cocktail_recipe, pattern='cocktail'),
-            CallbackQueryHandler(change_addresses, pattern='change_addresses'),
-            CallbackQueryHandler(change_admins, pattern='change_admins'),
-            CallbackQueryHandler(change_cocktail_recipe, pattern='change_cocktail_recipe'),
-            CallbackQueryHandler(change_contact_info, pattern='change_contact_info'),
-            CallbackQueryHandler(change_start_message, pattern='change_start_message'),
-            CallbackQueryHandler(change_review, pattern='change_review'),
-            CallbackQueryHandler(change_offers, pattern='change_offers'),
-            CallbackQueryHandler(change_recipe_photos, pattern='change_recipe_photos')
+            *callback_router.handlers(),
         ],
         states={
-            BACK_TO_START: [
-                CallbackQueryHandler(contact, pattern='contact'),
-                CallbackQueryHandler(map_locations, pattern='map'),
-                CallbackQueryHandler(offer, pattern='offer'),
-                CallbackQueryHandler(review, pattern='review'),
-                CallbackQueryHandler(handle_back, pattern='back'),
-                CallbackQueryHandler(cocktail_recipe, pattern='cocktail'),
-                CallbackQueryHandler(change_addresses, pattern='change_addresses'),
-                CallbackQueryHandler(change_admins, pattern='change_admins'),
-                CallbackQueryHandler(change_cocktail_recipe, pattern='change_cocktail_recipe'),
-                CallbackQueryHandler(change_contact_info, pattern='change_contact_info'),
-                CallbackQueryHandler(change_start_message, pattern='change_start_message'),
-                CallbackQueryHandler(change_review, pattern='change_review'),
-                CallbackQueryHandler(change_offers, pattern='change_offers'),
-                CallbackQueryHandler(send_broadcast, pattern='send_broadcast'),
-            ],
-            CONTACT: [CallbackQueryHandler(handle_back, pattern='back')],
-            MAP: [CallbackQueryHandler(handle_back, pattern='back')],
-            OFFER: [CallbackQueryHandler(handle_back, pattern='back')],
-            REVIEW: [CallbackQueryHandler(handle_back, pattern='back')],
-            COCKTAIL_RECIPE: [CallbackQueryHandler(handle_back, pattern='back')],
+            BACK_TO_START: callback_router.handlers(BACK_TO_START),
+            CONTACT: callback_router.handlers(CONTACT),
+            MAP: callback_router.handlers(MAP),
+            OFFER: callback_router.handlers(OFFER),
+            REVIEW: callback_router.handlers(REVIEW),
+            COCKTAIL_RECIPE: callback_router.handlers(COCKTAIL_RECIPE),
             CHANGE_ADDRESSES: [
                 MessageHandler(filters.TEXT & ~filters.COMMAND, save_new_addresses),
-                CallbackQueryHandler(handle_back, pattern='back')
+                *callback_router.handlers(CHANGE_ADDRESSES)
             ],
             CHANGE_ADMINS: [
                 MessageHandler(filters.TEXT & ~filters.COMMAND, save_new_admins),
-                CallbackQueryHandler(handle_back, pattern='back')
+                *callback_router.handlers(CHANGE_ADMINS)
             ],
             CHANGE_COCKTAIL_RECIPE: [
                 MessageHandler(filters.TEXT & ~filters.COMMAND, save_new_cocktail_recipe),
-                CallbackQueryHandler(handle_back, pattern='back')
+                *callback_router.handlers(CHANGE_COCKTAIL_RECIPE)
             ],
             CHANGE_CONTACT_INFO: [
                 MessageHandler(filters.TEXT & ~filters.COMMAND, save_new_contact_info),
-                CallbackQueryHandler(handle_back, pattern='back')
+                *callback_router.handlers(CHANGE_CONTACT_INFO)
             ],
             CHANGE_START_MESSAGE: [
                 MessageHandler(filters.TEXT & ~filters.COMMAND, save_new_start_message),
-                CallbackQueryHandler(handle_back, pattern='back')
+                *callback_router.handlers(CHANGE_START_MESSAGE)
             ],
             CHANGE_REVIEW: [
                 MessageHandler(filters.TEXT & ~filters.COMMAND, save_new_review),
-                CallbackQueryHandler(handle_back, pattern='back')
+                *callback_router.handlers(CHANGE_REVIEW)
             ],
             CHANGE_OFFERS: [
-                MessageHandler(filters.PHOTO, save_new_offers),
-                CallbackQueryHandler(handle_back, pattern='back')
+                MessageHandler(filters.PHOTO, save_new_offers, block=False),
+                *callback_router.handlers(CHANGE_OFFERS)
             ],
             CHANGE_RECIPE_PHOTOS: [
-                MessageHandler(filters.PHOTO, save_new_recipe_photos),
-                CallbackQueryHandler(handle_back, pattern='back')
+                MessageHandler(filters.PHOTO, save_new_recipe_photos, block=False),
+                *callback_router.handlers(CHANGE_RECIPE_PHOTOS)
             ],
             SEND_BROADCAST: [
                 MessageHandler(filters.TEXT & ~filters.COMMAND, do_broadcast),
-                CallbackQueryHandler(handle_back, pattern='back')
+                *callback_router.handlers(SEND_BROADCAST)
+            ],
+            CONFIRM_BROADCAST: callback_router.handlers(CONFIRM_BROADCAST),
+            ConversationHandler.WAITING: [
+                MessageHandler(filters.PHOTO, collect_album_photo),
+                callback_router.busy_handler()
             ],
         },
         fallbacks=[
             CommandHandler('start', start),
-            CommandHandler('cancel', lambda update, context: update.message.reply_text(
-                'Conversation cancelled.',
-                reply_markup=ReplyKeyboardRemove()
-            ))
+            CommandHandler('cancel', cancel)
         ],
         name="drink_stock_conversation",
         persistent=True,
         allow_reentry=True
     )
 
+    instrument_handlers(conv_handler)
+
     # Add handlers
     application.add_handler(conv_handler)
+    application.add_handler(InlineQueryHandler(instrument(inline_search)))
+    return application
+
 
-    # Start the bot
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+def main() -> None:
+    API_KEY = read_file('.env').strip()
+    # A self-hosted Bot API server (or the offline benchmarks' fake one) can replace api.telegram.org
+    base_url = os.environ.get('BOT_API_BASE_URL')
+    base_file_url = os.environ.get('BOT_API_BASE_FILE_URL')
+
+    # WORKERS=N runs N bot processes behind a single poller, sharded by chat id
+    workers = int(os.environ.get('WORKERS', '1'))
+    if workers > 1 and os.environ.get('BOT_MODE') == 'webhook':
+        raise SystemExit("WORKERS>1 only supports polling; unset BOT_MODE=webhook or WORKERS")
+    if workers > 1:
+        WorkerPool(API_KEY, workers, base_url=base_url, base_file_url=base_file_url).run_polling(
+            allowed_updates=ALLOWED_UPDATES)
+        return
+
+    application = build_application(API_KEY, base_url=base_url, base_file_url=base_file_url)
+    startup.mark('build handlers')
+
+    # BOT_MODE=webhook serves updates over HTTP (e.g. behind a reverse proxy) instead of polling
+    if os.environ.get('BOT_MODE') == 'webhook':
+        application.run_webhook(
+            listen=os.environ.get('WEBHOOK_LISTEN', '127.0.0.1'),
+            port=int(os.environ.get('WEBHOOK_PORT', '8443')),
+            url_path=os.environ.get('WEBHOOK_PATH', 'telegram'),
+            webhook_url=os.environ['WEBHOOK_URL'],
+            secret_token=os.environ['WEBHOOK_SECRET'],
+            max_connections=int(os.environ.get('WEBHOOK_MAX_CONNECTIONS', '40')),
+            allowed_updates=ALLOWED_UPDATES
+        )
+    else:
+        application.run_polling(allowed_updates=ALLOWED_UPDATES)
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
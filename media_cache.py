@@ -0,0 +1,89 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class MediaCache:
+    """Maps local photos to the `file_id` Telegram returned for them.
+
+    Entries are keyed by a hash of the file content; a per-path index of
+    (mtime, size, hash) avoids re-hashing files that have not changed.
+    """
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+        self.file_ids = {}
+        self.paths = {}
+        # Methods run in the I/O thread pool, so the maps are guarded by a lock
+        self._lock = threading.RLock()
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.file_path):
+            return
+        with open(self.file_path, 'r', encoding='utf-8') as file:
+            data = json.load(file)
+        self.file_ids = data.get('file_ids', {})
+        self.paths = data.get('paths', {})
+
+    def save(self):
+        with self._lock:
+            tmp_path = f"{self.file_path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as file:
+                json.dump({'file_ids': self.file_ids, 'paths': self.paths}, file)
+            os.replace(tmp_path, self.file_path)
+
+    def content_hash(self, path):
+        stat = os.stat(path)
+        with self._lock:
+            entry = self.paths.get(path)
+        if entry and entry[0] == stat.st_mtime_ns and entry[1] == stat.st_size:
+            return entry[2]
+        digest = hashlib.sha256()
+        with open(path, 'rb') as file:
+            for chunk in iter(lambda: file.read(65536), b''):
+                digest.update(chunk)
+        content_hash = digest.hexdigest()
+        with self._lock:
+            self.paths[path] = [stat.st_mtime_ns, stat.st_size, content_hash]
+        return content_hash
+
+    def photo(self, path):
+        # Returns the cached file_id, or the file content to upload the first time
+        file_id = self.file_ids.get(self.content_hash(path))
+        if file_id:
+            return file_id
+        with open(path, 'rb') as file:
+            return file.read()
+
+    def remember(self, path, file_id):
+        content_hash = self.content_hash(path)
+        with self._lock:
+            if self.file_ids.get(content_hash) == file_id:
+                return
+            self.file_ids[content_hash] = file_id
+        self.save()
+
+    def forget(self, path):
+        content_hash = self.content_hash(path)
+        with self._lock:
+            if self.file_ids.pop(content_hash, None) is None:
+                return
+        self.save()
+
+    def remember_message(self, path, message):
+        if message and message.photo:
+            self.remember(path, message.photo[-1].file_id)
+
+    def invalidate_dir(self, directory):
+        prefix = os.path.join(directory, '')
+        with self._lock:
+            stale = [path for path in self.paths if path.startswith(prefix)]
+            for path in stale:
+                self.file_ids.pop(self.paths.pop(path)[2], None)
+        if stale:
+            self.save()
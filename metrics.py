@@ -0,0 +1,240 @@
+import asyncio
+import bisect
+import collections
+import functools
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+
+from telegram.request import HTTPXRequest
+
+logger = logging.getLogger(__name__)
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    __slots__ = ('counts', 'total', 'count')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+class Metrics:
+    """Timing histograms, in-flight gauges and error counters per (kind, name).
+
+    `kind` is one of 'handler', 'bot_api' or 'sheets'; `name` is the handler
+    callback or the API method. `render()` returns Prometheus text format.
+    """
+
+    def __init__(self):
+        self.histograms = collections.defaultdict(Histogram)
+        self.in_flight = collections.defaultdict(int)
+        self.errors = collections.defaultdict(int)
+        self.profiler = None
+
+    def track(self, kind, name):
+        return _Timer(self, kind, name)
+
+    def render(self):
+        lines = []
+        for kind in sorted({key[0] for key in self.histograms}):
+            metric = f"drinkstock_{kind}_duration_seconds"
+            lines.append(f"# TYPE {metric} histogram")
+            for (histogram_kind, name), histogram in sorted(self.histograms.items()):
+                if histogram_kind != kind:
+                    continue
+                cumulative = 0
+                for bound, count in zip(BUCKETS + ('+Inf',), histogram.counts):
+                    cumulative += count
+                    lines.append(f'{metric}_bucket{{name="{name}",le="{bound}"}} {cumulative}')
+                lines.append(f'{metric}_sum{{name="{name}"}} {histogram.total}')
+                lines.append(f'{metric}_count{{name="{name}"}} {histogram.count}')
+        for title, values in (('in_flight', self.in_flight), ('errors_total', self.errors)):
+            kinds = sorted({key[0] for key in values})
+            for kind in kinds:
+                metric = f"drinkstock_{kind}_{title}"
+                lines.append(f"# TYPE {metric} {'gauge' if title == 'in_flight' else 'counter'}")
+                for (value_kind, name), value in sorted(values.items()):
+                    if value_kind == kind:
+                        lines.append(f'{metric}{{name="{name}"}} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+class _Timer:
+    __slots__ = ('metrics', 'key', 'start', 'token')
+
+    def __init__(self, metrics, kind, name):
+        self.metrics = metrics
+        self.key = (kind, name)
+
+    def __enter__(self):
+        self.metrics.in_flight[self.key] += 1
+        profiler = self.metrics.profiler
+        self.token = profiler.begin() if profiler is not None and self.key[0] == 'handler' else None
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.start
+        self.metrics.histograms[self.key].observe(elapsed)
+        self.metrics.in_flight[self.key] -= 1
+        if exc_type is not None and not issubclass(exc_type, asyncio.CancelledError):
+            self.metrics.errors[self.key] += 1
+        if self.token is not None:
+            self.metrics.profiler.end(self.token, self.key[1], elapsed)
+        return False
+
+
+metrics = Metrics()
+
+
+def instrument(callback, kind='handler', name=None):
+    if getattr(callback, '__instrumented__', False):
+        return callback
+    name = name or getattr(callback, '__name__', 'callback')
+
+    @functools.wraps(callback)
+    async def wrapper(*args, **kwargs):
+        with metrics.track(kind, name):
+            return await callback(*args, **kwargs)
+
+    wrapper.__instrumented__ = True
+    return wrapper
+
+
+class InstrumentedRequest(HTTPXRequest):
+    """HTTPXRequest that times every Bot API method."""
+
+    async def do_request(self, url, method, request_data=None, *args, **kwargs):
+        with metrics.track('bot_api', url.rsplit('/', 1)[-1]):
+            return await super().do_request(url, method, request_data, *args, **kwargs)
+
+
+class SlowUpdateProfiler:
+    """Sampling profiler for slow handlers.
+
+    While at least one handler is running, a background thread samples the
+    event loop thread's stack every `interval` seconds. Handlers that take
+    longer than `threshold` get the stacks sampled during their run logged.
+    """
+
+    def __init__(self, threshold: float, interval: float = 0.005, max_samples: int = 2000):
+        self.threshold = threshold
+        self.interval = interval
+        self.samples = collections.deque(maxlen=max_samples)
+        self.active = 0
+        self._thread_id = threading.get_ident()
+        self._wake = threading.Event()
+        threading.Thread(target=self._sample, name='slow-update-profiler', daemon=True).start()
+
+    def begin(self):
+        self.active += 1
+        self._wake.set()
+        return time.perf_counter()
+
+    def end(self, started, name, elapsed):
+        self.active -= 1
+        if elapsed < self.threshold:
+            return
+        stacks = collections.Counter(stack for timestamp, stack in list(self.samples) if timestamp >= started)
+        report = '\n'.join(f"{count} samples:\n{stack}" for stack, count in stacks.most_common(5))
+        logger.warning(f"Slow update in {name}: {elapsed * 1000:.1f} ms\n{report}")
+
+    def _sample(self):
+        while True:
+            if self.active <= 0:
+                self._wake.clear()
+                self._wake.wait()
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is not None:
+                stack = ''.join(traceback.format_stack(frame, limit=15))
+                self.samples.append((time.perf_counter(), stack))
+            time.sleep(self.interval)
+
+
+def _process_age():
+    # Seconds since this process was launched, from /proc where available
+    try:
+        with open('/proc/self/stat', 'r') as file:
+            start_ticks = int(file.read().rsplit(')', 1)[1].split()[19])
+        with open('/proc/uptime', 'r') as file:
+            uptime = float(file.read().split()[0])
+        return max(0.0, uptime - start_ticks / os.sysconf('SC_CLK_TCK'))
+    except (OSError, ValueError, IndexError, AttributeError):
+        return 0.0
+
+
+class StartupTimer:
+    """Wall-clock duration of each startup phase.
+
+    Phases are measured from process launch where the OS exposes it, so the
+    first one includes interpreter start-up and imports. Background phases run
+    concurrently with serving and are logged one by one as they finish.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter() - _process_age()
+        self.last = self.started
+        self.phases = []
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        self.phases.append((phase, now - self.last))
+        self.last = now
+
+    def measure(self, phase):
+        return _PhaseTimer(self, phase)
+
+    def report(self):
+        lines = [f"{phase:<28}{seconds * 1000:>9.1f} ms" for phase, seconds in self.phases]
+        lines.append(f"{'ready after':<28}{(self.last - self.started) * 1000:>9.1f} ms")
+        logger.info("Startup timing:\n" + '\n'.join(lines))
+
+
+class _PhaseTimer:
+    __slots__ = ('timer', 'phase', 'start')
+
+    def __init__(self, timer, phase):
+        self.timer = timer
+        self.phase = phase
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        logger.info(f"Startup warm-up: {self.phase} took {(time.perf_counter() - self.start) * 1000:.1f} ms")
+        return False
+
+
+startup = StartupTimer()
+
+
+async def serve_metrics(host: str, port: int):
+    async def handle(reader, writer):
+        try:
+            request_line = await reader.readline()
+            while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                pass
+            if request_line.split(b' ')[1:2] == [b'/metrics']:
+                body, status = metrics.render().encode(), b'200 OK'
+            else:
+                body, status = b'Not Found\n', b'404 Not Found'
+            writer.write(b'HTTP/1.1 ' + status + b'\r\nContent-Type: text/plain; version=0.0.4\r\n'
+                         b'Content-Length: ' + str(len(body)).encode() + b'\r\nConnection: close\r\n\r\n' + body)
+            await writer.drain()
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
@@ -0,0 +1,91 @@
+import asyncio
+import time
+from collections import deque
+
+
+class RateLimiter:
+    """Sliding-window limiter allowing at most `max_calls` per `period` seconds."""
+
+    def __init__(self, max_calls: int, period: float = 60):
+        self.max_calls = max_calls
+        self.period = period
+        self.calls = deque()
+        self._lock = None
+
+    async def acquire(self):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                while self.calls and now - self.calls[0] >= self.period:
+                    self.calls.popleft()
+                if len(self.calls) < self.max_calls:
+                    self.calls.append(now)
+                    return
+                await asyncio.sleep(self.period - (now - self.calls[0]))
+
+
+class FloodControl:
+    """Per-user token buckets and in-flight guards for callback actions.
+
+    `limits` maps an action to (burst, period): a user may trigger it `burst`
+    times in a row, after which one more use is refilled every
+    `period / burst` seconds. Actions without a limit are only guarded
+    against running twice at once for the same user.
+
+    With updates handled one at a time, a second tap during a non-blocking
+    route is answered by the router's WAITING handler before it gets here; the
+    in-flight guard covers the remaining cases, such as CONCURRENT_UPDATES.
+    """
+
+    def __init__(self, limits: dict, max_idle: float = 3600):
+        self.limits = limits
+        self.max_idle = max_idle
+        self.buckets = {}
+        self.in_flight = set()
+        self._last_prune = time.monotonic()
+
+    def _take(self, key, action, now):
+        limit = self.limits.get(action)
+        if limit is None:
+            return True
+        burst, period = limit
+        tokens, updated = self.buckets.get(key, (burst, now))
+        tokens = min(burst, tokens + (now - updated) * burst / period)
+        if tokens < 1:
+            self.buckets[key] = (tokens, now)
+            return False
+        self.buckets[key] = (tokens - 1, now)
+        return True
+
+    def _prune(self, now):
+        # Buckets idle for longer than any period are full again and can be forgotten
+        self._last_prune = now
+        self.buckets = {key: value for key, value in self.buckets.items() if now - value[1] < self.max_idle}
+
+    def acquire(self, user_id, action):
+        """Returns False when the action is already running for this user or its bucket is empty."""
+        key = (user_id, action)
+        if key in self.in_flight:
+            return False
+        now = time.monotonic()
+        if now - self._last_prune > self.max_idle:
+            self._prune(now)
+        if not self._take(key, action, now):
+            return False
+        self.in_flight.add(key)
+        return True
+
+    def release(self, user_id, action):
+        self.in_flight.discard((user_id, action))
+
+
+def parse_limits(spec: str) -> dict:
+    # "offer=2/60,back=5/10" -> {'offer': (2, 60.0), 'back': (5, 10.0)}
+    limits = {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        action, _, value = item.partition('=')
+        burst, _, period = value.partition('/')
+        limits[action.strip()] = (int(burst), float(period))
+    return limits
@@ -0,0 +1,108 @@
+from typing import Callable, NamedTuple, Optional
+
+from telegram import Update
+from telegram.ext import BaseHandler
+
+
+class Route(NamedTuple):
+    callback: Callable
+    states: frozenset
+    admin_only: bool = False
+    # False for slow routes: they run as a task and further taps meanwhile reach busy_handler()
+    block: bool = True
+
+
+async def _answer_only(update, context):
+    # Admin-only button pressed by someone else: stop the client's spinner, keep the state
+    await update.callback_query.answer()
+    return None
+
+
+DENIED = Route(_answer_only, frozenset())
+
+
+class CallbackRouter:
+    """Dispatch table keyed by exact `callback_data`.
+
+    `handler(state)` returns the handler to register for one conversation state
+    (`None` for the entry points); it only accepts routes allowed in that state.
+    With `allow_reentry=True` the ConversationHandler tries the entry points
+    before the current state's handlers, so a route whose `states` include
+    `None` is reachable from every state; `states` only restricts routes that
+    exclude `None`.
+    With `flood_control`, a tap that is throttled or duplicates one still being
+    handled only gets `busy_text` as a toast and leaves the state unchanged.
+    While a non-blocking route runs, the ConversationHandler only consults its
+    `WAITING` handlers for that user; `busy_handler()` registered there answers
+    taps with `busy_text` right away instead of leaving them unanswered.
+    """
+
+    def __init__(self, routes: dict, is_admin: Callable[[Optional[str]], bool], flood_control=None,
+                 busy_text: str = None):
+        self.routes = routes
+        self.is_admin = is_admin
+        self.flood_control = flood_control
+        self.busy_text = busy_text
+
+    def handler(self, state=None, block: bool = True):
+        return RouteHandler(self, state, block)
+
+    def handlers(self, state=None):
+        # `block` is read from the handler, so blocking and non-blocking routes need one each
+        return [RouteHandler(self, state, True), RouteHandler(self, state, False)]
+
+    def busy_handler(self):
+        return BusyHandler(self)
+
+
+class RouteHandler(BaseHandler):
+    __slots__ = ('router', 'state')
+
+    def __init__(self, router: CallbackRouter, state=None, block: bool = True):
+        super().__init__(self._dispatch, block=block)
+        self.router = router
+        self.state = state
+
+    def check_update(self, update: object):
+        if not isinstance(update, Update) or update.callback_query is None:
+            return None
+        route = self.router.routes.get(update.callback_query.data)
+        if route is None or self.state not in route.states or route.block != self.block:
+            return None
+        if route.admin_only and not self.router.is_admin(update.callback_query.from_user.username):
+            return DENIED
+        return route
+
+    async def handle_update(self, update, application, check_result, context):
+        flood_control = self.router.flood_control
+        if flood_control is None:
+            return await check_result.callback(update, context)
+        query = update.callback_query
+        if not flood_control.acquire(query.from_user.id, query.data):
+            await query.answer(self.router.busy_text)
+            return None
+        try:
+            return await check_result.callback(update, context)
+        finally:
+            flood_control.release(query.from_user.id, query.data)
+
+    async def _dispatch(self, update, context):
+        route = self.check_update(update)
+        return await route.callback(update, context)
+
+
+class BusyHandler(BaseHandler):
+    """Answers any routed tap with `busy_text` while a non-blocking route is still running."""
+
+    __slots__ = ('router',)
+
+    def __init__(self, router: CallbackRouter):
+        super().__init__(self._answer_busy)
+        self.router = router
+
+    def check_update(self, update: object):
+        return (isinstance(update, Update) and update.callback_query is not None
+                and update.callback_query.data in self.router.routes)
+
+    async def _answer_busy(self, update, context):
+        await update.callback_query.answer(self.router.busy_text)
@@ -0,0 +1,108 @@
+import html
+import re
+import unicodedata
+from collections import OrderedDict
+from typing import NamedTuple
+
+LINK_RE = re.compile(r'href="([^"]+)"')
+TAG_RE = re.compile(r'<[^>]+>')
+SECTOR_RE = re.compile(r'^Sectorul\s+(.+?)\s*:?\s*$')
+ANCHOR_RE = re.compile(r'<a\s+href="([^"]+)"\s*>(.*?)</a>', re.S)
+WORD_RE = re.compile(r'\w+')
+
+MAX_RESULTS = 50
+
+
+class Entry(NamedTuple):
+    kind: str
+    name: str
+    city: str = ''
+    sector: str = ''
+    link: str = ''
+
+
+def normalize(text: str) -> str:
+    # "Rîșcan" -> "riscan": case-folded, with accents, cedillas and commas below removed
+    decomposed = unicodedata.normalize('NFKD', text.casefold())
+    return ''.join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def parse_stores(content: str) -> list:
+    entries = []
+    city = sector = ''
+    for line in content.splitlines():
+        text = html.unescape(TAG_RE.sub('', line)).strip()
+        if text.startswith('🏙'):
+            city, sector = text[1:].strip(), ''
+        elif SECTOR_RE.match(text):
+            sector = SECTOR_RE.match(text).group(1)
+        elif '📍' in text:
+            link = LINK_RE.search(line)
+            street = text.split('📍', 1)[1].strip().rstrip(',').strip()
+            entries.append(Entry('store', street, city, sector, link.group(1) if link else ''))
+    return entries
+
+
+def parse_recipes(content: str) -> list:
+    return [Entry('recipe', html.unescape(TAG_RE.sub('', name)).strip(), link=html.unescape(link))
+            for link, name in ANCHOR_RE.findall(content)]
+
+
+class SearchIndex:
+    """Accent-insensitive prefix search over the store addresses and recipes.
+
+    Every word of every entry is indexed under all of its prefixes, so a query
+    is one set intersection per query word. Answers are rendered with `render`
+    and cached per normalized query; the index and the cache are rebuilt when
+    the content store's version of either source file changes.
+    """
+
+    def __init__(self, content_store, stores_path: str, recipes_path: str, render, cache_size: int = 1024):
+        self.content_store = content_store
+        self.stores_path = stores_path
+        self.recipes_path = recipes_path
+        self.render = render
+        self.cache_size = cache_size
+        self.entries = []
+        self.prefixes = {}
+        self.cache = OrderedDict()
+        self.source_versions = None
+
+    def rebuild(self):
+        self.entries = (parse_stores(self.content_store.get(self.stores_path))
+                        + parse_recipes(self.content_store.get(self.recipes_path)))
+        prefixes = {}
+        for position, entry in enumerate(self.entries):
+            for word in set(WORD_RE.findall(normalize(' '.join((entry.name, entry.city, entry.sector))))):
+                for length in range(1, len(word) + 1):
+                    prefixes.setdefault(word[:length], set()).add(position)
+        self.prefixes = prefixes
+        self.cache.clear()
+
+    def refresh(self):
+        versions = (self.content_store.versions.get(self.stores_path),
+                    self.content_store.versions.get(self.recipes_path))
+        if versions != self.source_versions:
+            self.rebuild()
+            self.source_versions = versions
+
+    def match(self, words):
+        if not words:
+            return self.entries[:MAX_RESULTS]
+        candidates = sorted((self.prefixes.get(word, set()) for word in words), key=len)
+        positions = set(candidates[0]).intersection(*candidates[1:])
+        return [self.entries[position] for position in sorted(positions)[:MAX_RESULTS]]
+
+    def search(self, query: str):
+        self.refresh()
+        words = WORD_RE.findall(normalize(query))
+        key = ' '.join(words)
+        results = self.cache.get(key)
+        if results is not None:
+            self.cache.move_to_end(key)
+            return results
+        results = self.render(self.match(words))
+        self.cache[key] = results
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return results
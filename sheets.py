@@ -0,0 +1,97 @@
+import asyncio
+import datetime
+import functools
+import logging
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import metrics
+from rate_limit import RateLimiter
+
+logger = logging.getLogger(__name__)
+
+SCOPE = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
+
+
+class SheetsClient:
+    """Long-lived Google Sheets session.
+
+    Credentials are loaded and authorized once, worksheet handles are cached and
+    every gspread call runs in a bounded thread pool behind `call()`.
+    """
+
+    def __init__(self, credentials_file: str = "credentials.json", max_workers: int = 4,
+                 requests_per_minute: int = 60, max_retries: int = 5):
+        self.credentials_file = credentials_file
+        self.max_retries = max_retries
+        self.limiter = RateLimiter(requests_per_minute)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='sheets')
+        self._client = None
+        self._worksheets = {}
+        self._client_lock = threading.Lock()
+
+    def _get_client(self):
+        with self._client_lock:
+            if self._client is None:
+                # The Sheets stack takes a noticeable part of startup, so it is only imported on first use
+                import gspread
+                from oauth2client.service_account import ServiceAccountCredentials
+                creds = ServiceAccountCredentials.from_json_keyfile_name(self.credentials_file, SCOPE)
+                self._client = gspread.authorize(creds)
+            return self._client
+
+    def _get_worksheet(self, sheet_name):
+        worksheet = self._worksheets.get(sheet_name)
+        if worksheet is None:
+            worksheet = self._get_client().open(sheet_name).sheet1
+            self._worksheets[sheet_name] = worksheet
+        return worksheet
+
+    async def run(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        for attempt in range(self.max_retries + 1):
+            await self.limiter.acquire()
+            try:
+                with metrics.track('sheets', getattr(func, '__name__', 'call')):
+                    return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+            except Exception as e:
+                if not _is_quota_error(e) or attempt == self.max_retries:
+                    raise
+                delay = min(2 ** attempt, 60)
+                logger.warning(f"Google Sheets quota exceeded, retrying in {delay}s")
+                await asyncio.sleep(delay)
+
+    async def worksheet(self, sheet_name):
+        if sheet_name in self._worksheets:
+            return self._worksheets[sheet_name]
+        return await self.run(self._get_worksheet, sheet_name)
+
+    async def call(self, sheet_name, method_name, *args, **kwargs):
+        worksheet = await self.worksheet(sheet_name)
+        return await self.run(getattr(worksheet, method_name), *args, **kwargs)
+
+    def _refresh_if_expiring(self, margin):
+        client = self._get_client()
+        expiry = client.auth.expiry
+        if expiry is None or expiry - datetime.datetime.utcnow() < margin:
+            client.login()
+            logger.info("Google Sheets access token refreshed")
+
+    async def refresh_loop(self, interval: float = 300, margin: float = 600):
+        while True:
+            try:
+                await self.run(self._refresh_if_expiring, datetime.timedelta(seconds=margin))
+            except Exception as e:
+                logger.warning(f"Google Sheets token refresh failed: {e}")
+            await asyncio.sleep(interval)
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+
+def _is_quota_error(error):
+    if 'gspread' not in sys.modules:
+        return False
+    from gspread.exceptions import APIError
+    return isinstance(error, APIError) and error.response.status_code == 429
@@ -0,0 +1,153 @@
+import asyncio
+import io
+import json
+import pickle
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+from telegram.ext import BasePersistence, PersistenceInput
+from telegram.ext._picklepersistence import _BotPickler, _BotUnpickler
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (name TEXT, key TEXT, state BLOB, PRIMARY KEY (name, key));
+CREATE TABLE IF NOT EXISTS user_data (user_id INTEGER PRIMARY KEY, data BLOB);
+CREATE TABLE IF NOT EXISTS chat_data (chat_id INTEGER PRIMARY KEY, data BLOB);
+CREATE TABLE IF NOT EXISTS bot_data (key BLOB PRIMARY KEY, data BLOB);
+CREATE TABLE IF NOT EXISTS callback_data (id INTEGER PRIMARY KEY CHECK (id = 1), data BLOB);
+"""
+
+
+class SQLitePersistence(BasePersistence):
+    """Persistence backed by a SQLite database in WAL mode.
+
+    Only the rows that changed are written: one row per conversation key, per
+    user/chat and per top-level `bot_data` entry. All writes queued during one
+    `Application.update_persistence` run are committed in a single transaction.
+    """
+
+    def __init__(self, filepath: str, store_data: PersistenceInput = None, update_interval: float = 60):
+        super().__init__(store_data=store_data, update_interval=update_interval)
+        self.filepath = filepath
+        self._connection = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='sqlite-persistence')
+        self._pending = []
+        self._commit_task = None
+        self._bot_data_blobs = {}
+
+    def _connect(self):
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.filepath, check_same_thread=False)
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute('PRAGMA synchronous=NORMAL')
+            self._connection.executescript(SCHEMA)
+        return self._connection
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    def _dumps(self, obj):
+        buffer = io.BytesIO()
+        _BotPickler(self.bot, buffer, protocol=pickle.HIGHEST_PROTOCOL).dump(obj)
+        return buffer.getvalue()
+
+    def _loads(self, data):
+        return _BotUnpickler(self.bot, io.BytesIO(data)).load()
+
+    def _fetch(self, sql, params=()):
+        return self._connect().execute(sql, params).fetchall()
+
+    def _write(self, operations):
+        connection = self._connect()
+        with connection:
+            for sql, params in operations:
+                connection.execute(sql, params)
+
+    async def _queue(self, sql, params):
+        self._pending.append((sql, params))
+        if self._commit_task is None:
+            self._commit_task = asyncio.get_running_loop().create_task(self._commit())
+        await self._commit_task
+
+    async def _commit(self):
+        # Let the other update_* coroutines of this round queue their writes first
+        await asyncio.sleep(0)
+        operations, self._pending = self._pending, []
+        self._commit_task = None
+        await self._run(self._write, operations)
+
+    async def get_user_data(self):
+        rows = await self._run(self._fetch, 'SELECT user_id, data FROM user_data')
+        return {user_id: self._loads(data) for user_id, data in rows}
+
+    async def get_chat_data(self):
+        rows = await self._run(self._fetch, 'SELECT chat_id, data FROM chat_data')
+        return {chat_id: self._loads(data) for chat_id, data in rows}
+
+    async def get_bot_data(self):
+        rows = await self._run(self._fetch, 'SELECT key, data FROM bot_data')
+        self._bot_data_blobs = {bytes(key): bytes(data) for key, data in rows}
+        return {self._loads(key): self._loads(data) for key, data in rows}
+
+    async def get_callback_data(self):
+        rows = await self._run(self._fetch, 'SELECT data FROM callback_data WHERE id = 1')
+        return self._loads(rows[0][0]) if rows else None
+
+    async def get_conversations(self, name):
+        rows = await self._run(self._fetch, 'SELECT key, state FROM conversations WHERE name = ?', (name,))
+        return {tuple(json.loads(key)): self._loads(state) for key, state in rows}
+
+    async def update_conversation(self, name, key, new_state):
+        if new_state is None:
+            await self._queue('DELETE FROM conversations WHERE name = ? AND key = ?', (name, json.dumps(key)))
+        else:
+            await self._queue('INSERT OR REPLACE INTO conversations (name, key, state) VALUES (?, ?, ?)',
+                              (name, json.dumps(key), self._dumps(new_state)))
+
+    async def update_user_data(self, user_id, data):
+        await self._queue('INSERT OR REPLACE INTO user_data (user_id, data) VALUES (?, ?)',
+                          (user_id, self._dumps(data)))
+
+    async def update_chat_data(self, chat_id, data):
+        await self._queue('INSERT OR REPLACE INTO chat_data (chat_id, data) VALUES (?, ?)',
+                          (chat_id, self._dumps(data)))
+
+    async def update_bot_data(self, data):
+        blobs = {self._dumps(key): self._dumps(value) for key, value in data.items()}
+        writes = []
+        for key in self._bot_data_blobs.keys() - blobs.keys():
+            writes.append(self._queue('DELETE FROM bot_data WHERE key = ?', (key,)))
+        for key, value in blobs.items():
+            if self._bot_data_blobs.get(key) != value:
+                writes.append(self._queue('INSERT OR REPLACE INTO bot_data (key, data) VALUES (?, ?)', (key, value)))
+        self._bot_data_blobs = blobs
+        if writes:
+            await asyncio.gather(*writes)
+
+    async def update_callback_data(self, data):
+        await self._queue('INSERT OR REPLACE INTO callback_data (id, data) VALUES (1, ?)', (self._dumps(data),))
+
+    async def drop_chat_data(self, chat_id):
+        await self._queue('DELETE FROM chat_data WHERE chat_id = ?', (chat_id,))
+
+    async def drop_user_data(self, user_id):
+        await self._queue('DELETE FROM user_data WHERE user_id = ?', (user_id,))
+
+    async def refresh_user_data(self, user_id, user_data):
+        pass
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
+
+    async def flush(self):
+        if self._commit_task is not None:
+            await self._commit_task
+        if self._connection is not None:
+            await self._run(self._close)
+
+    def _close(self):
+        self._connection.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        self._connection.close()
+        self._connection = None
@@ -0,0 +1,159 @@
+import asyncio
+import json
+import logging
+import os
+import re
+import time
+
+from blocking import run_blocking
+
+logger = logging.getLogger(__name__)
+
+SHEET_FIELDS = ('first_name', 'last_name', 'username', 'language')
+
+
+class UserRegistry:
+    """Local, deduplicated user store with write-behind sync to Google Sheets.
+
+    `record()` only touches memory; `flush()` persists the registry to disk and
+    pushes new or changed users to the sheet in batches.
+    """
+
+    def __init__(self, file_path: str, batch_size: int = 200):
+        self.file_path = file_path
+        self.batch_size = batch_size
+        self.users = {}
+        self.dirty = set()
+        self.seeded = False
+        self._disk_dirty = False
+        self._lock = None
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.file_path):
+            return
+        with open(self.file_path, 'r', encoding='utf-8') as file:
+            data = json.load(file)
+        self.seeded = data.get('seeded', False)
+        self.users = {int(user_id): info for user_id, info in data.get('users', {}).items()}
+        self.dirty = {user_id for user_id, info in self.users.items() if not info.get('synced')}
+
+    def snapshot(self):
+        return {'seeded': self.seeded, 'users': {str(user_id): dict(info) for user_id, info in self.users.items()}}
+
+    def save(self, data=None):
+        if data is None:
+            data = self.snapshot()
+        tmp_path = f"{self.file_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump(data, file, ensure_ascii=False)
+        os.replace(tmp_path, self.file_path)
+        self._disk_dirty = False
+
+    def record(self, user_id, first_name, last_name, username, language):
+        now = int(time.time())
+        profile = {'first_name': first_name, 'last_name': last_name, 'username': username, 'language': language}
+        info = self.users.get(user_id)
+        if info is None:
+            info = dict(profile, first_seen=now, row=None, synced=False)
+            self.users[user_id] = info
+            self.dirty.add(user_id)
+        elif any(info.get(field) != profile[field] for field in SHEET_FIELDS):
+            info.update(profile, synced=False)
+            self.dirty.add(user_id)
+        info['last_seen'] = now
+        info.pop('blocked', None)
+        self._disk_dirty = True
+        return info
+
+    def mark_blocked(self, user_id):
+        info = self.users.get(user_id)
+        if info is not None:
+            info['blocked'] = True
+            self._disk_dirty = True
+
+    def is_blocked(self, user_id):
+        info = self.users.get(user_id)
+        return info is not None and info.get('blocked', False)
+
+    def seed_from_rows(self, rows):
+        # Adopt users already present in the sheet so they are not appended again
+        for row_number, row in enumerate(rows, start=1):
+            if not row or not row[0].isdigit():
+                continue
+            user_id = int(row[0])
+            info = self.users.get(user_id)
+            if info is not None:
+                if info.get('row') is None:
+                    info['row'] = row_number
+                continue
+            values = (row + [''] * len(SHEET_FIELDS))[1:len(SHEET_FIELDS) + 1]
+            self.users[user_id] = dict(zip(SHEET_FIELDS, values), first_seen=None, last_seen=None,
+                                       row=row_number, synced=True)
+        self.seeded = True
+        self._disk_dirty = True
+
+    @staticmethod
+    def _sheet_row(user_id, info):
+        return [user_id] + [info.get(field) or '' for field in SHEET_FIELDS]
+
+    async def flush(self, sheets, sheet_name):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if not self.seeded:
+                self.seed_from_rows(await sheets.call(sheet_name, 'get_all_values'))
+            pending = [user_id for user_id in self.dirty if user_id in self.users]
+            for start in range(0, len(pending), self.batch_size):
+                batch = pending[start:start + self.batch_size]
+                sent = {user_id: self._sheet_row(user_id, self.users[user_id]) for user_id in batch}
+                new_users = [user_id for user_id in batch if self.users[user_id].get('row') is None]
+                changed_users = [user_id for user_id in batch if self.users[user_id].get('row') is not None]
+                if new_users:
+                    rows = [sent[user_id] for user_id in new_users]
+                    response = await sheets.call(sheet_name, 'append_rows', rows, table_range='A1:E1')
+                    first_row = _first_updated_row(response)
+                    if first_row is None:
+                        # Without row numbers a later edit would append these users again; keep them
+                        # dirty and pick up their rows from the sheet on the next flush
+                        logger.warning("Could not read the appended row numbers, re-reading the sheet next time")
+                        self.seeded = False
+                    for offset, user_id in enumerate(new_users):
+                        self.users[user_id]['row'] = first_row + offset if first_row else None
+                if changed_users:
+                    updates = [{'range': f"A{self.users[user_id]['row']}:E{self.users[user_id]['row']}",
+                                'values': [sent[user_id]]}
+                               for user_id in changed_users]
+                    await sheets.call(sheet_name, 'batch_update', updates)
+                for user_id in batch:
+                    # A user edited while the batch was in flight stays dirty for the next flush
+                    info = self.users[user_id]
+                    if info.get('row') is not None and self._sheet_row(user_id, info) == sent[user_id]:
+                        self.users[user_id]['synced'] = True
+                        self.dirty.discard(user_id)
+                self._disk_dirty = True
+                logger.info(f"Synced {len(new_users)} new and {len(changed_users)} changed users to Google Sheets")
+            if self._disk_dirty:
+                await run_blocking(self.save, self.snapshot())
+
+
+def _first_updated_row(response):
+    updated_range = (response or {}).get('updates', {}).get('updatedRange', '')
+    match = re.search(r'![A-Z]+(\d+)', updated_range)
+    return int(match.group(1)) if match else None
+
+
+async def sync_once(registry: UserRegistry, sheets, sheet_name):
+    if registry.dirty or not registry.seeded:
+        await registry.flush(sheets, sheet_name)
+    elif registry._disk_dirty:
+        await run_blocking(registry.save, registry.snapshot())
+
+
+async def run_sync_loop(registry: UserRegistry, sheets, sheet_name, interval: float = 30):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await sync_once(registry, sheets, sheet_name)
+        except Exception as e:
+            logger.warning(f"User registry sync failed: {e}")
@@ -0,0 +1,208 @@
+import asyncio
+import importlib
+import importlib.util
+import logging
+import multiprocessing
+import os
+import queue
+import sys
+import threading
+
+from telegram import Bot, Update
+from telegram.error import NetworkError, TelegramError
+
+logger = logging.getLogger(__name__)
+
+
+def shard_key(update: dict) -> int:
+    # The chat an update belongs to; callback queries carry it on their message
+    for value in update.values():
+        if not isinstance(value, dict):
+            continue
+        chat = value.get('chat') or (value.get('message') or {}).get('chat')
+        if chat:
+            return chat['id']
+        if 'from' in value:
+            return value['from']['id']
+    return 0
+
+
+class WorkerPool:
+    """Runs the bot in `count` processes, sharded by chat id.
+
+    The parent only receives updates and hands each one to worker
+    `chat_id % count`, so a conversation is always handled by the same process.
+    Workers share the content files, the photo directories and the SQLite
+    conversation store; edits are announced on an events queue and relayed to
+    the other workers, which reload what changed.
+    """
+
+    def __init__(self, token: str, count: int, module: str = 'main', base_url: str = None,
+                 base_file_url: str = None, log_level: int = None):
+        self.token = token
+        self.count = count
+        self.module = module
+        self.base_url = base_url
+        self.base_file_url = base_file_url
+        self.log_level = log_level
+        self.inboxes = []
+        self.processes = []
+        self.ready = 0
+        self._context = multiprocessing.get_context('spawn')
+        self._events = self._context.Queue()
+        self._ready_event = threading.Event()
+        self._relay_thread = None
+
+    def start(self):
+        # A spawned child inherits the environment at start() and re-runs the parent's __main__
+        # script before _worker_main; with WORKER_ID already set there, a bot launched as
+        # `python main.py` loads its per-worker state once and _worker_main reuses that module
+        saved = {name: os.environ.get(name) for name in ('WORKER_ID', 'WORKER_COUNT')}
+        try:
+            for index in range(self.count):
+                os.environ['WORKER_ID'] = str(index)
+                os.environ['WORKER_COUNT'] = str(self.count)
+                inbox = self._context.Queue()
+                process = self._context.Process(
+                    target=_worker_main, name=f'bot-worker-{index}',
+                    args=(index, self.count, self.module, self.token, inbox, self._events,
+                          self.base_url, self.base_file_url, self.log_level))
+                process.start()
+                self.inboxes.append(inbox)
+                self.processes.append(process)
+        finally:
+            for name, value in saved.items():
+                if value is None:
+                    os.environ.pop(name, None)
+                else:
+                    os.environ[name] = value
+        self._relay_thread = threading.Thread(target=self._relay, name='worker-events', daemon=True)
+        self._relay_thread.start()
+
+    def wait_ready(self, timeout: float = None):
+        return self._ready_event.wait(timeout)
+
+    def dispatch(self, update: dict):
+        self.inboxes[shard_key(update) % self.count].put(('update', update))
+
+    def _relay(self):
+        while True:
+            event = self._events.get()
+            if event is None:
+                return
+            source, kind, key = event
+            if kind == 'ready':
+                self.ready += 1
+                if self.ready == self.count:
+                    logger.info(f"{self.count} workers ready")
+                    self._ready_event.set()
+                continue
+            for index, inbox in enumerate(self.inboxes):
+                if index != source:
+                    inbox.put(('changed', (kind, key)))
+
+    def stop(self, timeout: float = 30):
+        for inbox in self.inboxes:
+            inbox.put(None)
+        for process in self.processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+        self._events.put(None)
+        if self._relay_thread is not None:
+            # Otherwise interpreter shutdown can kill it mid-read and print a traceback
+            self._relay_thread.join(timeout)
+
+    async def poll(self, allowed_updates=None, timeout: int = 30):
+        kwargs = {'base_url': self.base_url} if self.base_url else {}
+        async with Bot(self.token, **kwargs) as bot:
+            # Like Application.run_polling: getUpdates answers 409 Conflict while a webhook is set
+            await bot.delete_webhook()
+            offset = None
+            while True:
+                try:
+                    updates = await bot.get_updates(offset=offset, timeout=timeout, allowed_updates=allowed_updates)
+                except NetworkError as e:
+                    logger.warning(f"getUpdates failed: {e}")
+                    await asyncio.sleep(1)
+                    continue
+                except TelegramError as e:
+                    # e.g. Conflict with another poller; keep the workers alive and retry
+                    logger.error(f"getUpdates rejected: {e}")
+                    await asyncio.sleep(5)
+                    continue
+                for update in updates:
+                    offset = update.update_id + 1
+                    self.dispatch(update.to_dict())
+
+    def run_polling(self, allowed_updates=None):
+        self.start()
+        try:
+            asyncio.run(self.poll(allowed_updates))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+
+def _worker_main(index, count, module, token, inbox, events, base_url, base_file_url, log_level):
+    # Set before the bot module is imported so its state files get per-worker names
+    os.environ['WORKER_ID'] = str(index)
+    os.environ['WORKER_COUNT'] = str(count)
+    bot_module = _import_once(module)
+    if log_level is not None:
+        logging.getLogger().setLevel(log_level)
+    bot_module.change_publisher = lambda kind, key: events.put((index, kind, key))
+    try:
+        asyncio.run(_serve(bot_module, index, token, inbox, events, base_url, base_file_url))
+    except KeyboardInterrupt:
+        pass
+
+
+def _import_once(module):
+    # The parent's script, already run here as __mp_main__, is not imported a second time
+    main_module = sys.modules.get('__mp_main__')
+    spec = importlib.util.find_spec(module)
+    main_file = getattr(main_module, '__file__', None)
+    if module not in sys.modules and main_file and spec and spec.origin \
+            and os.path.samefile(main_file, spec.origin):
+        sys.modules[module] = main_module
+    return importlib.import_module(module)
+
+
+def _next_messages(inbox):
+    # Blocks for one message, then drains whatever else is already queued
+    messages = [inbox.get()]
+    while messages[-1] is not None:
+        try:
+            messages.append(inbox.get_nowait())
+        except queue.Empty:
+            break
+    return messages
+
+
+async def _serve(bot_module, index, token, inbox, events, base_url, base_file_url):
+    application = bot_module.build_application(token, base_url=base_url, base_file_url=base_file_url)
+    loop = asyncio.get_running_loop()
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+    await application.start()
+    events.put((index, 'ready', None))
+    try:
+        running = True
+        while running:
+            for message in await loop.run_in_executor(None, _next_messages, inbox):
+                if message is None:
+                    running = False
+                    break
+                kind, payload = message
+                if kind == 'update':
+                    await application.update_queue.put(Update.de_json(payload, application.bot))
+                else:
+                    await bot_module.apply_change(*payload)
+    finally:
+        await application.stop()
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)